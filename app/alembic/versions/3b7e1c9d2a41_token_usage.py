@@ -0,0 +1,62 @@
+"""token usage
+
+Revision ID: 3b7e1c9d2a41
+Revises: 6599928aeaad
+Create Date: 2026-10-17 10:12:40.215331
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+import app
+
+# revision identifiers, used by Alembic.
+revision: str = "3b7e1c9d2a41"
+down_revision: Union[str, Sequence[str], None] = "6599928aeaad"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "token_usage",
+        sa.Column("id", app.models.types.StringUUID(), nullable=False),
+        sa.Column("user_id", app.models.types.StringUUID(), nullable=False),
+        sa.Column("model", sa.String(length=100), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("requests", sa.Integer(), nullable=False),
+        sa.Column("prompt_tokens", sa.BigInteger(), nullable=False),
+        sa.Column("completion_tokens", sa.BigInteger(), nullable=False),
+        sa.Column("total_tokens", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+            nullable=True,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "user_id", "model", "day", name="uq_token_usage_user_model_day"
+        ),
+    )
+    op.create_index(
+        op.f("ix_token_usage_user_id"), "token_usage", ["user_id"], unique=False
+    )
+    op.create_index(op.f("ix_token_usage_day"), "token_usage", ["day"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_token_usage_day"), table_name="token_usage")
+    op.drop_index(op.f("ix_token_usage_user_id"), table_name="token_usage")
+    op.drop_table("token_usage")
@@ -0,0 +1,40 @@
+"""task batch progress
+
+Revision ID: 5e9b2d7c4f10
+Revises: d41a7f0c5e28
+Create Date: 2026-10-17 15:02:37.518204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "5e9b2d7c4f10"
+down_revision: Union[str, Sequence[str], None] = "d41a7f0c5e28"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for column in ("total", "completed", "failed"):
+        op.add_column(
+            "tasks",
+            sa.Column(
+                column, sa.Integer(), server_default=sa.text("0"), nullable=False
+            ),
+        )
+    op.add_column(
+        "tasks", sa.Column("output_file_id", sa.String(length=255), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("tasks", "output_file_id")
+    op.drop_column("tasks", "failed")
+    op.drop_column("tasks", "completed")
+    op.drop_column("tasks", "total")
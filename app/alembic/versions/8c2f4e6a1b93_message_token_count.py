@@ -0,0 +1,29 @@
+"""message token count
+
+Revision ID: 8c2f4e6a1b93
+Revises: 3b7e1c9d2a41
+Create Date: 2026-10-17 11:03:18.742906
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8c2f4e6a1b93"
+down_revision: Union[str, Sequence[str], None] = "3b7e1c9d2a41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("messages", sa.Column("token_count", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("messages", "token_count")
@@ -0,0 +1,53 @@
+"""message conversation created_at index
+
+Revision ID: a7c3e5f91b26
+Revises: 5e9b2d7c4f10
+Create Date: 2026-10-17 15:48:09.274615
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a7c3e5f91b26"
+down_revision: Union[str, Sequence[str], None] = "5e9b2d7c4f10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 大表上建索引不阻塞写入；(conversation_id, created_at, id) 覆盖原 conversation_id 索引
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_messages_conversation_id_created_at",
+            "messages",
+            ["conversation_id", "created_at", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_messages_conversation_id",
+            table_name="messages",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_messages_conversation_id",
+            "messages",
+            ["conversation_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_messages_conversation_id_created_at",
+            table_name="messages",
+            postgresql_concurrently=True,
+        )
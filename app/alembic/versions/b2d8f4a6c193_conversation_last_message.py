@@ -0,0 +1,85 @@
+"""conversation last message
+
+Revision ID: b2d8f4a6c193
+Revises: a7c3e5f91b26
+Create Date: 2026-10-17 16:21:44.803517
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b2d8f4a6c193"
+down_revision: Union[str, Sequence[str], None] = "a7c3e5f91b26"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "conversations",
+        sa.Column(
+            "message_count", sa.Integer(), server_default=sa.text("0"), nullable=False
+        ),
+    )
+    op.add_column(
+        "conversations",
+        sa.Column(
+            "last_message_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+    )
+    op.add_column(
+        "conversations",
+        sa.Column("last_message_preview", sa.String(length=255), nullable=True),
+    )
+    # 回填：消息数、最后一条消息的时间与预览（仅纯文本内容），没有消息的会话取创建时间
+    op.execute("""
+        UPDATE conversations AS c
+        SET message_count = s.message_count,
+            last_message_at = s.last_message_at,
+            last_message_preview = s.last_message_preview
+        FROM (
+            SELECT DISTINCT ON (conversation_id)
+                conversation_id,
+                count(*) OVER (PARTITION BY conversation_id) AS message_count,
+                created_at AS last_message_at,
+                CASE WHEN json_typeof(content) = 'string'
+                    THEN left(content #>> '{}', 120)
+                END AS last_message_preview
+            FROM messages
+            ORDER BY conversation_id, created_at DESC, id DESC
+        ) AS s
+        WHERE c.id = s.conversation_id
+        """)
+    op.execute("""
+        UPDATE conversations
+        SET last_message_at = created_at
+        WHERE message_count = 0 AND created_at IS NOT NULL
+        """)
+    op.create_index(
+        "ix_conversations_created_by_last_message_at",
+        "conversations",
+        ["created_by", sa.text("last_message_at DESC")],
+        unique=False,
+    )
+    op.drop_index("ix_conversations_created_by", table_name="conversations")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(
+        "ix_conversations_created_by", "conversations", ["created_by"], unique=False
+    )
+    op.drop_index(
+        "ix_conversations_created_by_last_message_at", table_name="conversations"
+    )
+    op.drop_column("conversations", "last_message_preview")
+    op.drop_column("conversations", "last_message_at")
+    op.drop_column("conversations", "message_count")
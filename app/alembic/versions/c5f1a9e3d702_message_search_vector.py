@@ -0,0 +1,72 @@
+"""message search vector
+
+Revision ID: c5f1a9e3d702
+Revises: b2d8f4a6c193
+Create Date: 2026-10-17 16:58:12.641930
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "c5f1a9e3d702"
+down_revision: Union[str, Sequence[str], None] = "b2d8f4a6c193"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 迁移时固定的生成列表达式，不随模型或 CHAT_SEARCH_TEXT_CONFIG 变化；
+# 更换分词配置需要新的迁移重建该列
+SEARCH_VECTOR_EXPRESSION = (
+    "to_tsvector('simple'::regconfig, coalesce(message_content_text(content), ''))"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 提取消息 content 的文本：字符串直接返回，多模态数组拼接 type=text 的部分
+    op.execute("""
+        CREATE OR REPLACE FUNCTION message_content_text(content json)
+        RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$
+            SELECT CASE json_typeof(content)
+                WHEN 'string' THEN content #>> '{}'
+                WHEN 'array' THEN (
+                    SELECT string_agg(part ->> 'text', ' ')
+                    FROM json_array_elements(content) AS part
+                    WHERE json_typeof(part) = 'object' AND part ->> 'type' = 'text'
+                )
+            END
+        $$
+        """)
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    # 生成列会重写 messages 表，大表应在低峰期执行
+    op.add_column(
+        "messages",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(SEARCH_VECTOR_EXPRESSION, persisted=True),
+            nullable=True,
+        ),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_messages_created_by_search_vector",
+            "messages",
+            ["created_by", "search_vector"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_messages_created_by_search_vector", table_name="messages")
+    op.drop_column("messages", "search_vector")
+    op.execute("DROP FUNCTION IF EXISTS message_content_text(json)")
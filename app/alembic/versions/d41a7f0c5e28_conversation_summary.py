@@ -0,0 +1,37 @@
+"""conversation summary
+
+Revision ID: d41a7f0c5e28
+Revises: 8c2f4e6a1b93
+Create Date: 2026-10-17 13:26:51.390127
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "d41a7f0c5e28"
+down_revision: Union[str, Sequence[str], None] = "8c2f4e6a1b93"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("conversations", sa.Column("summary", sa.Text(), nullable=True))
+    op.add_column(
+        "conversations", sa.Column("summary_token_count", sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        "conversations",
+        sa.Column("summarized_until", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("conversations", "summarized_until")
+    op.drop_column("conversations", "summary_token_count")
+    op.drop_column("conversations", "summary")
@@ -0,0 +1,45 @@
+"""conversation archive
+
+Revision ID: e8a4c2b6f035
+Revises: c5f1a9e3d702
+Create Date: 2026-10-17 17:40:26.915384
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e8a4c2b6f035"
+down_revision: Union[str, Sequence[str], None] = "c5f1a9e3d702"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "conversations",
+        sa.Column("archived_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "conversations", sa.Column("archive_key", sa.String(length=255), nullable=True)
+    )
+    op.create_index(
+        "ix_conversations_last_message_at_unarchived",
+        "conversations",
+        ["last_message_at"],
+        unique=False,
+        postgresql_where=sa.text("archive_key IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_conversations_last_message_at_unarchived", table_name="conversations"
+    )
+    op.drop_column("conversations", "archive_key")
+    op.drop_column("conversations", "archived_at")
@@ -0,0 +1,33 @@
+"""conversation summarized until id
+
+Revision ID: f2b9d6e4a813
+Revises: e8a4c2b6f035
+Create Date: 2026-10-17 20:32:08.174265
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import app
+
+# revision identifiers, used by Alembic.
+revision: str = "f2b9d6e4a813"
+down_revision: Union[str, Sequence[str], None] = "e8a4c2b6f035"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 已有的摘要进度不回填，按时间过滤直到下一次压缩写入完整边界
+    op.add_column(
+        "conversations",
+        sa.Column("summarized_until_id", app.models.types.StringUUID(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("conversations", "summarized_until_id")
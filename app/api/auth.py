@@ -6,6 +6,7 @@ from app.models.db import get_db
 from app.schemas.user import UserCreate, User, LoginRequest
 from app.schemas.token import Token, TokenData
 from app.crud.user import user_crud
+from app.models.user import UserStatus
 from app.core.security import verify_password, create_access_token, decode_access_token
 from app.config import settings
 from datetime import timedelta, datetime, timezone
@@ -52,14 +53,35 @@ async def get_current_user(
     return user
 
 
+async def get_current_user_id(
+    token: Annotated[str, Depends(oauth2_scheme)],
+) -> str:
+    """
+    仅从 JWT token 中解析当前用户 ID，不查询数据库，只用于对话等热路径；
+    已删除或禁用用户的 token 在过期前仍然有效，其他接口使用 get_current_active_user。
+    """
+    payload = decode_access_token(token)
+    user_id: Optional[str] = payload.get("sub") if payload else None
+    try:
+        return str(UUID(user_id))
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无法验证凭据",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
 async def get_current_active_user(
     current_user: Annotated[User, Depends(get_current_user)],
 ) -> User:
     """
     获取当前活跃用户，确保用户没有被禁用。
     """
-    # if not current_user.is_active:
-    #     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="用户已被禁用")
+    if current_user.status != UserStatus.ACTIVE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="用户已被禁用"
+        )
     return current_user
 
 
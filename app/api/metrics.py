@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+
+from app.core.metrics import metrics
+from app.schemas.response import ApiResponse
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("")
+async def get_metrics():
+    """导出进程内指标快照"""
+    return ApiResponse(data=metrics.snapshot())
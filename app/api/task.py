@@ -6,7 +6,7 @@ from app.models.db import get_db
 from app.models.task import TaskStatus
 from app.models.user import User
 from app.schemas.response import ApiResponse
-from app.schemas.task import TaskCreate, TaskListIn, TaskListOut
+from app.schemas.task import TaskCreate, TaskListIn, TaskListOut, TaskOut
 from app.tasks.task import task_create
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -56,3 +56,33 @@ async def list_task(
     data["size"] = list_in.size
     data["list"] = pydantic.TypeAdapter(list[TaskListOut]).validate_python(data["list"])
     return ApiResponse(data=data, code=200, msg="success")
+
+
+@router.get("/{id}")
+async def get_task(
+    id: str,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """任务状态与进度，批量推理任务包含已处理条数与结果文件"""
+    t = await crud.task.get(db, primary_key=id)
+    if t is None or str(t.created_by) != str(user.id):
+        raise HTTPException(status_code=404, detail="Task not found")
+    return ApiResponse(data=TaskOut.model_validate(t), code=200, msg="success")
+
+
+@router.post("/{id}/cancel")
+async def cancel_task(
+    id: str,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """取消未完成的任务，批量推理任务在当前分段完成后停止"""
+    t = await crud.task.get(db, primary_key=id)
+    if t is None or str(t.created_by) != str(user.id):
+        raise HTTPException(status_code=404, detail="Task not found")
+    if t.status in (TaskStatus.PENDING, TaskStatus.PROGRESS):
+        t = await crud.task.update(
+            db, db_obj=t, obj_in={"status": TaskStatus.CANCELLED}
+        )
+    return ApiResponse(data=TaskOut.model_validate(t), code=200, msg="success")
@@ -0,0 +1,53 @@
+import asyncio
+import uuid
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.api.auth import get_current_user
+from app.models.db import get_db
+from app.models.task import TaskStatus
+from app.models.user import User
+from app.schemas.response import ApiResponse
+from app.schemas.task import BatchCreate, TaskOut
+from app.tasks.batch import run_batch
+
+router = APIRouter(prefix="/v1/batches", tags=["batch"])
+
+
+@router.post("", response_model=ApiResponse[TaskOut])
+async def api_create_batch(
+    payload: BatchCreate,
+    db: Annotated[AsyncSession, Depends(get_db)],
+    user: Annotated[User, Depends(get_current_user)],
+):
+    """
+    以文件服务上传的 JSONL 文件创建批量推理任务，返回的任务ID即批次ID，
+    进度通过 /task/{id} 查询，完成后结果文件ID见 output_file_id
+    """
+    file = await crud.file.get(db, primary_key=payload.file_id)
+    if file is None or str(file.created_by) != str(user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
+        )
+    if file.extension not in ("jsonl", "ndjson"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Batch input must be JSONL"
+        )
+
+    batch_id = str(uuid.uuid4())
+    task = await crud.task.insert(
+        db,
+        obj_in={
+            "id": batch_id,
+            "task_id": batch_id,
+            "file_id": payload.file_id,
+            "status": TaskStatus.PENDING,
+            "created_by": user.id,
+        },
+    )
+    # 任务记录先于 Celery 任务写入，Celery 任务ID与批次ID相同
+    await asyncio.to_thread(run_batch.apply_async, args=[batch_id], task_id=batch_id)
+    return ApiResponse(data=TaskOut.model_validate(task))
@@ -1,11 +1,17 @@
-import json
-from fastapi import Depends, APIRouter, HTTPException, status
+from fastapi import (
+    BackgroundTasks,
+    Depends,
+    APIRouter,
+    Header,
+    HTTPException,
+    status,
+)
 from fastapi.responses import StreamingResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.api.auth import get_current_active_user, get_current_user
-from app.models.chat import Conversation, RoleType
-from app.models.db import get_db
+from app.api.auth import get_current_active_user, get_current_user_id
+from app.models.chat import RoleType
+from app.models.db import AutocommitSessionLocal, get_db
 from app.models.user import User
 from app.schemas.chat import (
     ChatCompletionRequest,
@@ -15,15 +21,41 @@ from app.schemas.chat import (
     ConversationListOut,
     ConversationOut,
     HistoryMessage,
+    MessageHistoryIn,
     MessageOut,
+    MessageSearchHit,
+    MessageSearchIn,
+    MessageSearchOut,
 )
-from typing import Annotated, Any, AsyncGenerator, List
+from typing import Annotated, Any, Literal, Optional, Tuple
 from uuid import UUID
+from datetime import datetime
+from pydantic import TypeAdapter
+import asyncio
+import base64
+import html
+import json
 import logging
 from app.core.router import APIRoute
-from app.crud.chat import conversation_crud, message_crud
-from app.core.llm.llm import llm_provider
+from app.core.sse import SSEStreamingResponse
+from app.crud.chat import (
+    HIGHLIGHT_START,
+    HIGHLIGHT_STOP,
+    conversation_crud,
+    message_crud,
+)
+from app.core.llm import llm_provider
+from app.core.llm.admission import AdmissionRejected, admission_controller
+from app.core.llm.context import assemble_context, count_content, token_count_cache
+from app.core.llm.tokens import complete_usage, content_text
+from app.core.metering import usage_meter
 from app.schemas.response import ApiResponse
+from app.services.chat_archive import rehydrate
+from app.services.chat_history import build_server_history, context_cache
+from app.services.chat_export import export_ndjson, gzip_stream
+from app.services.chat_service import ChatStream
+from app.services.generation_log import generation_log
+from app.tasks.compaction import schedule_compaction
 
 router = APIRouter(route_class=APIRoute)
 logger = logging.getLogger(__name__)
@@ -53,7 +85,6 @@ async def api_list_conversations(
         page=list_in.page,
         created_by=current_user.id,
     )
-    print("conversations", convs)
     return ApiResponse(data=ConversationListOut(**convs))
 
 
@@ -69,47 +100,14 @@ async def api_get_conversation(id: UUID, db: AsyncSession = Depends(get_db)):
 
 @router.delete("/v1/conversation/{id}", response_model=ApiResponse[bool])
 async def api_delete_conversation(id: UUID, db: AsyncSession = Depends(get_db)):
+    conv = await conversation_crud.get(db, primary_key=id)
     await conversation_crud.delete(db, primary_key=id)
+    if conv is not None:
+        # 服务端历史模式下不再使用已删除会话的上下文
+        await context_cache.invalidate(str(id), conv.created_by)
     return ApiResponse[bool](success=True, data=True)
 
 
-async def stream_and_save_response(
-    request: ChatCompletionRequest,
-    db: AsyncSession,
-    conversation_id: str,
-    created_by: str,
-) -> AsyncGenerator[str, None]:
-
-    full_content = ""
-    finish_reason = None
-
-    async for chunk_str in llm_provider.stream_generate(request):
-        yield chunk_str
-        if chunk_str.strip() and chunk_str.startswith("data:"):
-            data_part = chunk_str[len("data:") :].strip()
-            if data_part != "[DONE]":
-                try:
-                    chunk_data = json.loads(data_part)
-                    choice = chunk_data.get("choices", [{}])[0]
-                    delta = choice.get("delta", {})
-                    if "content" in delta and delta["content"]:
-                        full_content += delta["content"]
-                    if "finish_reason" in choice and choice["finish_reason"]:
-                        finish_reason = choice["finish_reason"]
-                except json.JSONDecodeError:
-                    continue
-
-    assistant_message_data = {
-        "conversation_id": conversation_id,
-        "role": RoleType.ASSISTANT,
-        "content": full_content,
-        "model": request.model,
-        "finish_reason": finish_reason,
-        "created_by": created_by,
-    }
-    await message_crud.insert(db, obj_in=assistant_message_data)
-
-
 # aip/api/v1/chat.py 或者一个工具文件中
 
 from typing import List, Dict, Any, Union
@@ -131,85 +129,286 @@ def _get_title_from_message_content(
     return "新的对话"
 
 
+async def _insert_user_turn(request: ChatCompletionRequest, user_id: str):
+    """会话与用户消息在一条语句中写入，不查询用户、不做 refresh，写入后追加到上下文缓存"""
+    last_user_message = request.messages[-1]
+    token_count = token_count_cache.count(last_user_message, request.model)
+    async with AutocommitSessionLocal() as db:
+        conversation_id = await message_crud.insert_user_turn(
+            db,
+            conversation_id=request.conversation_id,
+            created_by=user_id,
+            content=last_user_message.content,
+            title=_get_title_from_message_content(last_user_message.content),
+            token_count=token_count,
+        )
+    if conversation_id is not None:
+        await context_cache.append(
+            conversation_id,
+            user_id,
+            RoleType.USER.value,
+            last_user_message.content,
+            token_count,
+            create=request.conversation_id is None,
+        )
+    return conversation_id
+
+
 @router.post("/v1/chat/completions")
 async def api_chat_completions(
     request: ChatCompletionRequest,
-    db: Annotated[AsyncSession, Depends(get_db)],
-    current_user: Annotated[User, Depends(get_current_user)],
+    user_id: Annotated[str, Depends(get_current_user_id)],
+    background_tasks: BackgroundTasks,
 ):
-    print("api_chat_completions", current_user.id)
-    # 1. 查找或创建会话
-    conversation_id = request.conversation_id
-    if not conversation_id:
-        new_conversation = Conversation(
-            created_by=current_user.id,
-            # current_model=request.model,
-            title=_get_title_from_message_content(request.messages),
+    if not await usage_meter.check_quota(user_id):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Daily token quota exceeded",
         )
-        db.add(new_conversation)
-        await db.commit()
-        await db.refresh(new_conversation)
-        conversation_id = new_conversation.id
 
-    last_user_message = request.messages[-1]
-    user_message_data = {
-        "conversation_id": conversation_id,
-        "role": RoleType.USER,
-        "content": last_user_message.content,
-        "created_by": current_user.id,
-    }
-    await message_crud.insert(db, obj_in=user_message_data)
+    counts = None
+    compact = False
+    if request.history == "server":
+        rebuilt = await build_server_history(
+            request.conversation_id, user_id, request.messages, request.model
+        )
+        if rebuilt is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found",
+            )
+        request.messages, counts, compact = rebuilt
+    request.messages = assemble_context(request.messages, request.model, counts)
+
+    try:
+        permit = await admission_controller.acquire(user_id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many concurrent requests",
+            headers={"Retry-After": str(e.retry_after)},
+        )
 
+    # 上游请求与用户消息写入并行，写入完成后才返回响应并在之后保存助手消息，
+    # 保证用户消息先于助手消息提交；写入失败时取消上游请求
     if request.stream:
-        return StreamingResponse(
-            stream_and_save_response(request, db, conversation_id, current_user.id),
-            media_type="text/event-stream",
+        stream = ChatStream(request, None, user_id, compact=compact, permit=permit)
+        stream.start()
+        upstream = stream
+    else:
+        upstream = asyncio.create_task(llm_provider.generate(request))
+        upstream.add_done_callback(lambda _: permit.release())
+
+    try:
+        conversation_id = await _insert_user_turn(request, user_id)
+    except BaseException:
+        upstream.cancel()
+        raise
+    if conversation_id is None:
+        upstream.cancel()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found"
+        )
+
+    if request.stream:
+        await stream.set_conversation(conversation_id)
+        return SSEStreamingResponse(
+            stream,
+            headers={
+                "X-Conversation-Id": str(conversation_id),
+                "X-Generation-Id": stream.generation_id,
+            },
         )
     else:
-        response = await llm_provider.generate(request)
+        response = await upstream
 
         assistant_message = response.choices[0].message
-        usage = response.usage
+        usage = complete_usage(
+            request, content_text(assistant_message.content), response.usage
+        )
+        usage_meter.record(user_id, request.model, usage)
         assistant_message_data = {
             "conversation_id": conversation_id,
             "role": RoleType.ASSISTANT,
             "content": assistant_message.content,
             "model": response.model,
-            "prompt_tokens": usage.prompt_tokens if usage else None,
-            "completion_tokens": usage.completion_tokens if usage else None,
-            "total_tokens": usage.total_tokens if usage else None,
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "total_tokens": usage.total_tokens,
             "finish_reason": response.choices[0].finish_reason,
-            "created_by": current_user.id,
+            "token_count": count_content(assistant_message.content, request.model),
+            "created_by": user_id,
         }
-        await message_crud.insert(db, obj_in=assistant_message_data)
+        async with AutocommitSessionLocal() as db:
+            await message_crud.append_message(db, obj_in=assistant_message_data)
+        await context_cache.append(
+            conversation_id,
+            user_id,
+            RoleType.ASSISTANT.value,
+            assistant_message.content,
+            assistant_message_data["token_count"],
+        )
+        if compact:
+            background_tasks.add_task(schedule_compaction, conversation_id)
 
         return response
 
 
+@router.get("/v1/conversation/{conversation_id}/stream")
+async def api_resume_stream(
+    conversation_id: str,
+    user_id: Annotated[str, Depends(get_current_user_id)],
+    last_event_id: Annotated[Optional[str], Header()] = None,
+):
+    """
+    订阅会话当前（或刚结束）的生成：携带 Last-Event-ID 时从该事件之后续读，
+    否则从头读取；不会再次请求上游。
+    """
+    found = (
+        await generation_log.lookup(conversation_id)
+        if generation_log is not None
+        else None
+    )
+    if found is None or found[1] != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Generation not found"
+        )
+    generation_id = found[0]
+    try:
+        after = int(last_event_id or 0)
+    except ValueError:
+        after = 0
+    return SSEStreamingResponse(
+        generation_log.subscribe(generation_id, after),
+        headers={"X-Generation-Id": generation_id},
+    )
+
+
+def _encode_cursor(created_at: datetime, id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), str(UUID(id))
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+
+_history_adapter = TypeAdapter(List[HistoryMessage])
+
+
 @router.get(
     "/v1/conversation/{conversation_id}/messages",
     response_model=ApiResponse[ConversationHistoryResponse],
 )
 async def get_conversation_history(
     conversation_id: str,
+    history_in: Annotated[MessageHistoryIn, Depends()],
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
-
-    conversation = await message_crud.list_messages(
-        db, conversation_id, created_by=current_user.id
+    """从最新的消息开始向前分页，每页按时间顺序返回"""
+    user_id = current_user.id
+    before = _decode_cursor(history_in.cursor) if history_in.cursor else None
+    page = await message_crud.list_messages(
+        db, conversation_id, user_id, limit=history_in.limit, before=before
     )
-
-    if not conversation:
+    if page is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
+    if page[0].archive_key:
+        # 已归档的会话首次打开时回迁消息
+        await rehydrate(page[0])
+        page = await message_crud.list_messages(
+            db, conversation_id, user_id, limit=history_in.limit, before=before
+        )
 
-    conversation.messages.sort(key=lambda m: m.created_at)
-    messages = [HistoryMessage.model_validate(msg) for msg in conversation.messages]
+    conversation, rows, has_more = page
+    messages = _history_adapter.validate_python(rows)
+    next_cursor = None
+    if has_more and messages:
+        next_cursor = _encode_cursor(messages[0].created_at, messages[0].id)
     return ApiResponse(
         data=ConversationHistoryResponse(
             id=conversation.id,
             title=conversation.title,
             current_model="",
             messages=messages,
+            next_cursor=next_cursor,
+            has_more=has_more,
         )
     )
+
+
+def _highlight(snippet: Optional[str]) -> str:
+    """转义原文后把高亮标记替换为 <mark>"""
+    return (
+        html.escape(snippet or "")
+        .replace(HIGHLIGHT_START, "<mark>")
+        .replace(HIGHLIGHT_STOP, "</mark>")
+    )
+
+
+@router.get("/v1/messages/search", response_model=ApiResponse[MessageSearchOut])
+async def api_search_messages(
+    search_in: Annotated[MessageSearchIn, Depends()],
+    db: Annotated[AsyncSession, Depends(get_db)],
+    current_user: Annotated[User, Depends(get_current_active_user)],
+):
+    """在当前用户的全部消息中全文检索，按相关度返回带高亮摘要的结果"""
+    rows = await message_crud.search_messages(
+        db, current_user.id, search_in.q, limit=search_in.limit, offset=search_in.offset
+    )
+    hits = [
+        MessageSearchHit(**{**row, "snippet": _highlight(row["snippet"])})
+        for row in rows
+    ]
+    return ApiResponse(data=MessageSearchOut(list=hits))
+
+
+def _export_response(
+    user_id: str, conversation_id: Optional[str], compress: str
+) -> StreamingResponse:
+    body = export_ndjson(user_id, conversation_id)
+    filename = f"conversations-{conversation_id or 'all'}.ndjson"
+    media_type = "application/x-ndjson"
+    if compress == "gzip":
+        body = gzip_stream(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/v1/export/conversations")
+async def api_export_conversations(
+    db: Annotated[AsyncSession, Depends(get_db)],
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    compress: Literal["none", "gzip"] = "none",
+):
+    """以 NDJSON 流式导出当前用户的全部会话"""
+    # 导出使用独立的会话分批读取，流式输出期间不占用请求的数据库连接
+    await db.close()
+    return _export_response(current_user.id, None, compress)
+
+
+@router.get("/v1/export/conversations/{conversation_id}")
+async def api_export_conversation(
+    conversation_id: str,
+    db: Annotated[AsyncSession, Depends(get_db)],
+    current_user: Annotated[User, Depends(get_current_active_user)],
+    compress: Literal["none", "gzip"] = "none",
+):
+    """以 NDJSON 流式导出单个会话"""
+    conversation = await conversation_crud.get_by_id(db, conversation_id)
+    if conversation is None or conversation.created_by != current_user.id:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    await db.close()
+    return _export_response(current_user.id, conversation_id, compress)
@@ -5,7 +5,14 @@ celery_app = Celery(
     "tasks",
     broker=settings.CELERY_BROKER_URL,
     backend=settings.CELERY_RESULT_BACKEND,
-    include=["app.tasks.example", "app.schedule.periodic", "app.tasks.task"],
+    include=[
+        "app.tasks.example",
+        "app.schedule.periodic",
+        "app.tasks.task",
+        "app.tasks.compaction",
+        "app.tasks.batch",
+        "app.tasks.archive",
+    ],
 )
 
 celery_app.conf.update(
@@ -1,6 +1,51 @@
+from typing import Literal, Optional
+
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 
 
+class LLMTransportConfig(BaseModel):
+    """
+    LLM 提供者的 HTTP 传输配置
+    """
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 50
+    keepalive_expiry: float = 60
+    http2: bool = False
+    connect_timeout: float = 5
+    read_timeout: float = 120
+    write_timeout: float = 10
+    pool_timeout: float = 10
+    connect_retries: int = 1
+    # DNS 解析结果缓存时间（秒，0 表示不缓存）
+    dns_cache_ttl: float = 300
+
+
+class SyntheticLLMConfig(BaseModel):
+    """
+    合成 LLM 后端配置，用于压测与容量评估。
+    分布可选 fixed / uniform / normal / lognormal / exponential，
+    spread 对 uniform 为相对幅度，对 normal / lognormal 为标准差（normal 为相对值）。
+    """
+
+    ttft_ms: float = 300
+    ttft_distribution: str = "lognormal"
+    ttft_spread: float = 0.3
+    tokens_per_second: float = 50
+    token_distribution: str = "uniform"
+    token_spread: float = 0.2
+    # 每次响应的 token 数在 [min, max] 内均匀分布，受请求 max_tokens 限制
+    response_tokens_min: int = 100
+    response_tokens_max: int = 300
+    # 首包前失败的概率及返回的状态码
+    error_rate: float = 0
+    error_status: int = 500
+    # 流式输出中途失败的概率
+    stream_error_rate: float = 0
+    seed: int | None = None
+
+
 class Settings(BaseSettings):
     """
     配置类
@@ -38,6 +83,10 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = "fastapi"
     POSTGRES_HOST: str = "db"
     POSTGRES_PORT: int = 5432
+    # 数据库连接池
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
 
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
@@ -59,8 +108,149 @@ class Settings(BaseSettings):
 
     DOMAIN: str = "http://localhost/"
 
+    OPENAI_API_KEY: str = ""
+    OPENAI_BASE_URL: str = "https://api.openai.com/v1"
+    OPENAI_TRANSPORT: LLMTransportConfig = LLMTransportConfig()
+
+    SILICONFLOW_API_KEY: str = ""
+    SILICONFLOW_BASE_URL: str = "https://api.siliconflow.cn/v1"
+    SILICONFLOW_TRANSPORT: LLMTransportConfig = LLMTransportConfig()
+
+    SYNTHETIC_LLM: SyntheticLLMConfig = SyntheticLLMConfig()
+
+    # 模型路由：模型名 -> 候选后端列表，未配置的模型使用 LLM_DEFAULT_BACKENDS
+    # 可选后端：local / synthetic / openai / siliconflow
+    LLM_ROUTES: dict[str, list[str]] = {}
+    LLM_DEFAULT_BACKENDS: list[str] = ["siliconflow"]
+    # 后端首包延迟与错误率的 EWMA 平滑系数
+    LLM_ROUTER_EWMA_ALPHA: float = 0.2
+    # 连续失败多少次后打开熔断，以及熔断后多久进入半开探测
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    LLM_CIRCUIT_RECOVERY_SECONDS: float = 30
+    # 首包延迟超过该值（秒）计为一次失败，0 表示不按延迟熔断
+    LLM_CIRCUIT_SLOW_SECONDS: float = 0
+    # 对冲请求：首包超过该后端最近延迟的 LLM_HEDGE_PERCENTILE 分位数仍未到达时，
+    # 向同一或其他后端再发一个相同请求，取先到者
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95
+    # 对冲延迟下限（秒），避免在延迟很低时过度对冲
+    LLM_HEDGE_MIN_DELAY: float = 0.2
+    # 样本数不足 LLM_HEDGE_MIN_SAMPLES 时使用的对冲延迟（秒）
+    LLM_HEDGE_DEFAULT_DELAY: float = 2
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+
+    # 精确匹配补全缓存：进程内 LRU + Redis 两级，默认只缓存 temperature=0 的请求
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_DETERMINISTIC_ONLY: bool = True
+    LLM_CACHE_REDIS_ENABLED: bool = True
+    LLM_CACHE_TTL: int = 3600
+    LLM_CACHE_LOCAL_MAX_ENTRIES: int = 1024
+    LLM_CACHE_LOCAL_MAX_BYTES: int = 64 * 1024 * 1024
+    # 单条缓存的大小上限（字节），超过则不缓存
+    LLM_CACHE_MAX_ENTRY_BYTES: int = 256 * 1024
+
+    # 合并相同的进行中请求，共享同一次上游生成
+    LLM_SINGLE_FLIGHT_ENABLED: bool = False
+    # 仅合并 temperature=0 的请求
+    LLM_SINGLE_FLIGHT_DETERMINISTIC_ONLY: bool = False
+
+    # 上游调用准入控制（按进程生效，0 表示不限制）：全局与单用户并发上限，
+    # 超出上限的请求最多排队 LLM_ADMISSION_QUEUE_SIZE 个、等待 LLM_ADMISSION_TIMEOUT 秒
+    LLM_MAX_CONCURRENCY: int = 64
+    LLM_MAX_CONCURRENCY_PER_USER: int = 4
+    LLM_ADMISSION_QUEUE_SIZE: int = 256
+    LLM_ADMISSION_TIMEOUT: float = 30
+
+    # 流式响应直通模式：原样转发上游 SSE 字节流，仅扫描需要持久化的字段
+    LLM_STREAM_PASSTHROUGH: bool = False
+    # 流式请求要求上游返回用量（stream_options.include_usage），未返回时在本地估算
+    LLM_STREAM_INCLUDE_USAGE: bool = True
+
+    # SSE 帧合并窗口（毫秒，0 表示不合并）与单次写出的字节上限
+    SSE_COALESCE_WINDOW_MS: int = 20
+    SSE_COALESCE_MAX_BYTES: int = 4096
+    # 上游与写出之间最多缓冲的帧数，客户端读取慢时上游读取随之暂停
+    SSE_COALESCE_QUEUE_SIZE: int = 256
+    # SSE 空闲心跳间隔（秒，0 表示关闭）
+    SSE_HEARTBEAT_INTERVAL: float = 15
+
+    # 上下文组装：按模型选择本地 tokenizer（heuristic 或 tiktoken:<encoding>，模型名支持通配符）
+    LLM_DEFAULT_TOKENIZER: str = "heuristic"
+    LLM_TOKENIZERS: dict[str, str] = {}
+    LLM_TOKEN_COUNT_CACHE_SIZE: int = 10000
+    # 发送给上游的 prompt token 预算，默认 0 不裁剪；可全局开启或按模型（支持通配符）单独开启
+    LLM_CONTEXT_DEFAULT_BUDGET: int = 0
+    LLM_CONTEXT_BUDGETS: dict[str, int] = {}
+
+    # 服务端历史模式的会话上下文缓存：memory（单进程）或 redis
+    CHAT_CONTEXT_CACHE_BACKEND: Literal["memory", "redis"] = "memory"
+    # 每个会话缓存的最近消息条数，也是从数据库加载历史的条数上限
+    CHAT_CONTEXT_CACHE_MAX_MESSAGES: int = 200
+    CHAT_CONTEXT_CACHE_MAX_CONVERSATIONS: int = 10000
+    CHAT_CONTEXT_CACHE_TTL: int = 3600
+
+    # 长会话后台压缩：未纳入摘要的消息条数或 token 数超过阈值时，由 Celery 任务把较早的消息
+    # 增量压缩为摘要，服务端历史模式发送摘要 + 最近的消息
+    CHAT_COMPACTION_ENABLED: bool = True
+    CHAT_COMPACTION_TRIGGER_MESSAGES: int = 100
+    CHAT_COMPACTION_TRIGGER_TOKENS: int = 12000
+    # 保留不压缩的最近消息条数
+    CHAT_COMPACTION_KEEP_RECENT: int = 20
+    # 每次摘要调用纳入的消息 token 上限，超过时分多轮增量压缩
+    CHAT_COMPACTION_CHUNK_TOKENS: int = 8000
+    CHAT_COMPACTION_MAX_SUMMARY_TOKENS: int = 1024
+    # 摘要使用的模型，为空时使用会话最近一条助手消息的模型
+    CHAT_COMPACTION_MODEL: Optional[str] = None
+    # 同一会话的压缩任务去重时间（秒）
+    CHAT_COMPACTION_LOCK_TTL: int = 600
+
+    # 客户端断开后的流式生成策略：cancel 立即取消上游生成，background 在后台生成完并保存
+    CHAT_STREAM_DISCONNECT_POLICY: Literal["cancel", "background"] = "cancel"
+    # 生成任务与客户端之间最多缓冲的事件数，客户端读取慢时暂停读取上游
+    CHAT_STREAM_QUEUE_SIZE: int = 256
+    # 生成事件日志，支持 Last-Event-ID 断点续传与多个订阅者：
+    # memory 为进程内环形缓冲区，redis 为 Redis Streams，none 关闭
+    CHAT_STREAM_LOG_BACKEND: Literal["none", "memory", "redis"] = "memory"
+    # 每次生成保留的事件数、生成结束后日志的保留时间（秒）
+    CHAT_STREAM_LOG_MAX_EVENTS: int = 10000
+    CHAT_STREAM_LOG_TTL: int = 300
+    # cancel 策略下客户端断开后等待重连的时间（秒），期间无订阅者接入才取消生成
+    CHAT_STREAM_RESUME_GRACE: float = 10
+
+    # 消息全文检索使用的 PostgreSQL 文本检索配置；中文需安装分词扩展（如 zhparser）并创建对应配置，
+    # 修改后需要重建 messages.search_vector 列
+    CHAT_SEARCH_TEXT_CONFIG: str = "simple"
+
+    # 会话导出时服务端游标每批读取的消息条数
+    CHAT_EXPORT_BATCH_SIZE: int = 1000
+
+    # 冷会话归档：每日把超过 CHAT_ARCHIVE_AFTER_DAYS 天未活跃的会话消息压缩存入对象存储，
+    # 每次最多处理 CHAT_ARCHIVE_BATCH_SIZE 个会话；会话再次打开时自动回迁
+    CHAT_ARCHIVE_ENABLED: bool = False
+    CHAT_ARCHIVE_AFTER_DAYS: int = 90
+    CHAT_ARCHIVE_BATCH_SIZE: int = 500
+
+    # 批量推理：单个任务的并发与每秒请求数上限（0 表示不限制），单条请求的重试次数与退避基数（秒），
+    # 每段检查点的条数，单个任务的最大条数，以及任务整体失败后的重试次数
+    BATCH_CONCURRENCY: int = 8
+    BATCH_MAX_REQUESTS_PER_SECOND: float = 0
+    BATCH_MAX_RETRIES: int = 3
+    BATCH_RETRY_BACKOFF: float = 2
+    BATCH_CHECKPOINT_SIZE: int = 100
+    BATCH_MAX_LINES: int = 50000
+    BATCH_TASK_MAX_RETRIES: int = 3
+
+    # token 用量计量：按用户、模型、日期在内存中聚合，定期或累积到一定条数后批量落库
+    USAGE_FLUSH_INTERVAL: float = 10
+    USAGE_FLUSH_MAX_PENDING: int = 1000
+    # 每个用户每日 token 配额（0 表示不限制），已落库用量的缓存时间（秒）
+    TOKEN_QUOTA_DAILY: int = 0
+    USAGE_QUOTA_CACHE_TTL: float = 30
+
     class Config:
         env_file = ".env"
+        # 嵌套配置可通过 SILICONFLOW_TRANSPORT__HTTP2=true 这样的环境变量覆盖
+        env_nested_delimiter = "__"
 
 
 settings = Settings()
@@ -0,0 +1,17 @@
+from app.config import settings
+from app.core.llm.cache import CachingProvider
+from app.core.llm.llm import ModelProvider
+from app.core.llm.router import RouterProvider
+from app.core.llm.singleflight import SingleFlightProvider
+
+
+def create_llm_provider() -> ModelProvider:
+    provider: ModelProvider = RouterProvider.from_settings()
+    if settings.LLM_CACHE_ENABLED:
+        provider = CachingProvider(provider)
+    if settings.LLM_SINGLE_FLIGHT_ENABLED:
+        provider = SingleFlightProvider(provider)
+    return provider
+
+
+llm_provider = create_llm_provider()
@@ -0,0 +1,154 @@
+"""
+上游调用准入控制。
+
+在调用 llm_provider 之前按全局与单用户并发上限发放许可，超出上限的请求进入有界的
+等待队列（先进先出，单用户已满的请求不阻塞其他用户）；队列已满或等待超时时拒绝，
+由调用方返回 429 与 Retry-After，避免单个用户占满上游配额。
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from app.config import settings
+from app.core.metrics import metrics
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"admission rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Permit:
+    """一次上游调用的许可，调用结束后释放，重复释放无副作用"""
+
+    def __init__(self, controller: "AdmissionController", user_id: str):
+        self._controller = controller
+        self.user_id = user_id
+        self.acquired_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._controller._release(self)
+
+
+class _Waiter:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class AdmissionController:
+    """
+    进程内的并发准入控制，上限为 0 表示不限制。
+    多进程部署时上限按进程生效。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_per_user: int,
+        queue_size: int,
+        timeout: float,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self._per_user: Dict[str, int] = {}
+        self._waiters: Deque[_Waiter] = deque()
+        # 许可平均持有时间，用于估算 Retry-After
+        self._mean_hold: Optional[float] = None
+        metrics.gauge("llm_admission_active", lambda: self.active)
+        metrics.gauge("llm_admission_queue_depth", lambda: len(self._waiters))
+
+    def _can_admit(self, user_id: str) -> bool:
+        if self.max_concurrency and self.active >= self.max_concurrency:
+            return False
+        if self.max_per_user and self._per_user.get(user_id, 0) >= self.max_per_user:
+            return False
+        return True
+
+    def _admit(self, user_id: str) -> Permit:
+        self.active += 1
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        return Permit(self, user_id)
+
+    def retry_after(self) -> int:
+        """按队列长度与平均持有时间估算的重试等待秒数"""
+        hold = self._mean_hold or 1.0
+        slots = self.max_concurrency or max(self.active, 1)
+        return max(1, math.ceil(hold * (len(self._waiters) + 1) / slots))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        metrics.incr("llm_admission_rejected", reason=reason)
+        return AdmissionRejected(reason, self.retry_after())
+
+    async def acquire(self, user_id: str) -> Permit:
+        user_id = str(user_id)
+        # 仍有等待者时说明它们因全局或自身上限受阻，新请求满足条件即可直接准入
+        if self._can_admit(user_id):
+            metrics.observe("llm_admission_wait_seconds", 0)
+            return self._admit(user_id)
+        if len(self._waiters) >= self.queue_size:
+            raise self._reject("queue_full")
+
+        waiter = _Waiter(user_id)
+        self._waiters.append(waiter)
+        start = time.monotonic()
+        try:
+            permit = await asyncio.wait_for(
+                asyncio.shield(waiter.future), self.timeout or None
+            )
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 超时与准入同时发生，归还已发放的许可
+                waiter.future.result().release()
+            else:
+                waiter.future.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject("timeout") from None
+        metrics.observe("llm_admission_wait_seconds", time.monotonic() - start)
+        return permit
+
+    def _release(self, permit: Permit):
+        self.active -= 1
+        count = self._per_user[permit.user_id] - 1
+        if count:
+            self._per_user[permit.user_id] = count
+        else:
+            del self._per_user[permit.user_id]
+
+        hold = time.monotonic() - permit.acquired_at
+        self._mean_hold = (
+            hold
+            if self._mean_hold is None
+            else self._mean_hold + 0.1 * (hold - self._mean_hold)
+        )
+        self._dispatch()
+
+    def _dispatch(self):
+        """按排队顺序准入等待者，跳过自身并发已满的用户"""
+        for waiter in list(self._waiters):
+            if self.max_concurrency and self.active >= self.max_concurrency:
+                return
+            if self._can_admit(waiter.user_id):
+                self._waiters.remove(waiter)
+                waiter.future.set_result(self._admit(waiter.user_id))
+
+
+admission_controller = AdmissionController(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_per_user=settings.LLM_MAX_CONCURRENCY_PER_USER,
+    queue_size=settings.LLM_ADMISSION_QUEUE_SIZE,
+    timeout=settings.LLM_ADMISSION_TIMEOUT,
+)
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import AsyncGenerator, List, Optional
+
+from app.config import settings
+from app.core.llm.llm import ModelProvider
+from app.core.llm.stream import StreamEvent, completion_to_events
+from app.core.metrics import metrics
+from app.core.redis import redis_client
+from app.schemas.chat import (
+    ChatCompletionChoice,
+    ChatCompletionRequest,
+    ChatCompletionResponse,
+    ChatMessage,
+    Usage,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def cache_hit_usage() -> Usage:
+    """命中缓存没有消耗上游 token，显式返回 0，避免调用方按缺失用量在本地估算并计费"""
+    return Usage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+
+
+def cache_key(request: ChatCompletionRequest) -> str:
+    """按模型、消息与采样参数计算请求的规范化哈希，忽略会话ID与是否流式"""
+    payload = {
+        "model": request.model,
+        "messages": [
+            {"role": m.role.lower(), "content": m.content} for m in request.messages
+        ],
+        "temperature": request.temperature,
+        "top_p": request.top_p,
+        "n": request.n,
+        "stop": request.stop,
+        "max_tokens": request.max_tokens,
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class LRUCache:
+    """进程内 LRU 缓存，按条目数与总字节数淘汰，条目带过期时间"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            self._pop(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        if key in self._data:
+            self._pop(key)
+        self._data[key] = (value, time.monotonic() + ttl)
+        self.size += len(value)
+        while self._data and (
+            len(self._data) > self.max_entries or self.size > self.max_bytes
+        ):
+            self._pop(next(iter(self._data)))
+
+    def _pop(self, key: str):
+        value, _ = self._data.pop(key)
+        self.size -= len(value)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CompletionCache:
+    """两级补全缓存：进程内 LRU 在前，Redis 在后"""
+
+    prefix = "llm:completion:"
+
+    def __init__(self):
+        self.local = LRUCache(
+            settings.LLM_CACHE_LOCAL_MAX_ENTRIES, settings.LLM_CACHE_LOCAL_MAX_BYTES
+        )
+        metrics.gauge(
+            "llm_cache_local",
+            lambda: {"entries": len(self.local), "bytes": self.local.size},
+        )
+
+    async def get(self, key: str) -> Optional[ChatCompletionResponse]:
+        value = self.local.get(key)
+        tier = "local"
+        if value is None and settings.LLM_CACHE_REDIS_ENABLED:
+            try:
+                value = await redis_client.get(self.prefix + key)
+            except Exception as e:
+                logger.warning(f"completion cache redis get failed: {e}")
+            if value is not None:
+                tier = "redis"
+                self.local.set(key, value, settings.LLM_CACHE_TTL)
+        if value is None:
+            metrics.incr("llm_cache_misses")
+            return None
+        metrics.incr("llm_cache_hits", tier=tier)
+        return ChatCompletionResponse.model_validate_json(value)
+
+    async def set(self, key: str, response: ChatCompletionResponse):
+        value = response.model_dump_json(exclude_none=True).encode()
+        if len(value) > settings.LLM_CACHE_MAX_ENTRY_BYTES:
+            return
+        self.local.set(key, value, settings.LLM_CACHE_TTL)
+        if settings.LLM_CACHE_REDIS_ENABLED:
+            try:
+                await redis_client.set(
+                    self.prefix + key, value, ex=settings.LLM_CACHE_TTL
+                )
+            except Exception as e:
+                logger.warning(f"completion cache redis set failed: {e}")
+
+
+class CachingProvider(ModelProvider):
+    """
+    精确匹配补全缓存。
+    可缓存的请求（默认仅 temperature=0 且 n=1）命中时直接返回缓存结果，
+    流式请求以合成的 SSE 事件回放，不访问上游；未命中时透传并在正常结束后写入缓存。
+    """
+
+    def __init__(
+        self, provider: ModelProvider, cache: Optional[CompletionCache] = None
+    ):
+        self.provider = provider
+        self.cache = cache or CompletionCache()
+
+    def cacheable(self, request: ChatCompletionRequest) -> bool:
+        if request.n not in (None, 1):
+            return False
+        return not settings.LLM_CACHE_DETERMINISTIC_ONLY or request.temperature == 0
+
+    async def generate(self, request: ChatCompletionRequest) -> ChatCompletionResponse:
+        if not self.cacheable(request):
+            return await self.provider.generate(request)
+
+        key = cache_key(request)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            cached.usage = cache_hit_usage()
+            return cached
+
+        response = await self.provider.generate(request)
+        if response.choices and response.choices[0].finish_reason:
+            await self.cache.set(key, response)
+        return response
+
+    async def stream_events(
+        self, request: ChatCompletionRequest
+    ) -> AsyncGenerator[StreamEvent, None]:
+        if not self.cacheable(request):
+            async with aclosing(self.provider.stream_events(request)) as stream:
+                async for event in stream:
+                    yield event
+            return
+
+        key = cache_key(request)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            for event in completion_to_events(cached):
+                if event.finish_reason:
+                    event.usage = cache_hit_usage()
+                yield event
+            return
+
+        content_parts: List[str] = []
+        finish_reason = None
+        failed = False
+        async with aclosing(self.provider.stream_events(request)) as stream:
+            async for event in stream:
+                yield event
+                if event.error is not None:
+                    failed = True
+                if event.content:
+                    content_parts.append(event.content)
+                if event.finish_reason:
+                    finish_reason = event.finish_reason
+
+        if failed or not finish_reason:
+            return
+        now_ts = int(time.time())
+        await self.cache.set(
+            key,
+            ChatCompletionResponse(
+                id=f"cache-{key[:16]}",
+                created=now_ts,
+                model=request.model or "",
+                choices=[
+                    ChatCompletionChoice(
+                        index=0,
+                        message=ChatMessage(
+                            role="assistant", content="".join(content_parts)
+                        ),
+                        finish_reason=finish_reason,
+                    )
+                ],
+            ),
+        )
@@ -0,0 +1,169 @@
+"""
+上下文组装。
+
+按模型选择本地 tokenizer 计算每条消息的 token 数，在预算内保留全部 system 消息与
+最近的若干条消息，避免长会话超出上下文长度或为陈旧历史付费。
+tokenizer 可通过 register_tokenizer 扩展，并在 LLM_TOKENIZERS 中按模型配置。
+"""
+
+import fnmatch
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Protocol, Sequence
+
+from app.config import settings
+from app.core.llm.tokens import MESSAGE_OVERHEAD_TOKENS, content_text, estimate_tokens
+from app.core.metrics import metrics
+from app.schemas.chat import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+class Tokenizer(Protocol):
+    name: str
+
+    def count(self, text: str) -> int: ...
+
+
+class HeuristicTokenizer:
+    """无依赖的估算 tokenizer"""
+
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        return estimate_tokens(text)
+
+
+class TiktokenTokenizer:
+    """基于 tiktoken 的 tokenizer，需要安装 tiktoken"""
+
+    def __init__(self, encoding: str = "cl100k_base"):
+        import tiktoken  # type: ignore[import]
+
+        self.name = f"tiktoken:{encoding}"
+        self._encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+_factories: Dict[str, Callable[[str], Tokenizer]] = {
+    "heuristic": lambda _: HeuristicTokenizer(),
+    "tiktoken": lambda arg: TiktokenTokenizer(arg or "cl100k_base"),
+}
+_tokenizers: Dict[str, Tokenizer] = {}
+
+
+def register_tokenizer(name: str, factory: Callable[[str], Tokenizer]):
+    """注册 tokenizer，factory 接收配置中冒号后的参数，如 tiktoken:o200k_base"""
+    _factories[name] = factory
+
+
+def _create_tokenizer(spec: str) -> Tokenizer:
+    name, _, arg = spec.partition(":")
+    factory = _factories.get(name)
+    if factory is None:
+        raise ValueError(f"unknown tokenizer {spec}")
+    try:
+        return factory(arg)
+    except ImportError as e:
+        logger.warning(f"tokenizer {spec} unavailable ({e}), falling back to heuristic")
+        return HeuristicTokenizer()
+
+
+def get_tokenizer(model: Optional[str]) -> Tokenizer:
+    """按 LLM_TOKENIZERS（模型名支持通配符）选择 tokenizer，未配置时使用默认 tokenizer"""
+    spec = settings.LLM_DEFAULT_TOKENIZER
+    for pattern, candidate in settings.LLM_TOKENIZERS.items():
+        if fnmatch.fnmatchcase(model or "", pattern):
+            spec = candidate
+            break
+    tokenizer = _tokenizers.get(spec)
+    if tokenizer is None:
+        tokenizer = _tokenizers[spec] = _create_tokenizer(spec)
+    return tokenizer
+
+
+def count_content(content, model: Optional[str]) -> int:
+    """单条消息的 token 数，包含消息模板开销"""
+    return get_tokenizer(model).count(content_text(content)) + MESSAGE_OVERHEAD_TOKENS
+
+
+class TokenCountCache:
+    """按 tokenizer 与内容摘要缓存 token 数，客户端重复发送的历史消息不必重新计算"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, int] = OrderedDict()
+
+    def count(self, message: ChatMessage, model: Optional[str]) -> int:
+        tokenizer = get_tokenizer(model)
+        text = content_text(message.content)
+        key = hashlib.blake2b(
+            f"{tokenizer.name}\0{text}".encode(), digest_size=16
+        ).hexdigest()
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+            return value
+        value = self._data[key] = tokenizer.count(text) + MESSAGE_OVERHEAD_TOKENS
+        if len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+        return value
+
+
+token_count_cache = TokenCountCache(settings.LLM_TOKEN_COUNT_CACHE_SIZE)
+
+
+def context_budget(model: Optional[str]) -> int:
+    for pattern, budget in settings.LLM_CONTEXT_BUDGETS.items():
+        if fnmatch.fnmatchcase(model or "", pattern):
+            return budget
+    return settings.LLM_CONTEXT_DEFAULT_BUDGET
+
+
+def select_context(
+    messages: Sequence[ChatMessage], counts: Sequence[int], budget: int
+) -> List[ChatMessage]:
+    """
+    保留全部 system 消息，再从最新的消息往前选取，直到超出预算；
+    最后一条消息总是保留。返回的消息保持原有顺序。
+    """
+    remaining = budget - sum(
+        count for m, count in zip(messages, counts) if m.role == "system"
+    )
+    keep = [m.role == "system" for m in messages]
+    for i in range(len(messages) - 1, -1, -1):
+        if keep[i]:
+            continue
+        if counts[i] > remaining and i != len(messages) - 1:
+            break
+        keep[i] = True
+        remaining -= counts[i]
+    return [m for m, kept in zip(messages, keep) if kept]
+
+
+def assemble_context(
+    messages: Sequence[ChatMessage],
+    model: Optional[str],
+    counts: Optional[Sequence[Optional[int]]] = None,
+    budget: Optional[int] = None,
+) -> List[ChatMessage]:
+    """
+    在 token 预算内组装发送给上游的消息。
+    counts 为已知的每条消息 token 数（例如数据库中缓存的值），缺失的在本地计算。
+    预算为 0 时不裁剪。
+    """
+    budget = context_budget(model) if budget is None else budget
+    if not budget:
+        return list(messages)
+    counts = [
+        known if known is not None else token_count_cache.count(m, model)
+        for m, known in zip(messages, counts or [None] * len(messages))
+    ]
+    selected = select_context(messages, counts, budget)
+    dropped = len(messages) - len(selected)
+    if dropped:
+        metrics.incr("llm_context_dropped_messages", dropped, model=model or "")
+    return selected
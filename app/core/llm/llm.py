@@ -1,7 +1,8 @@
 import asyncio
+import logging
+from contextlib import aclosing
 from datetime import datetime
-import os
-from typing import AsyncGenerator, Optional
+from typing import AsyncGenerator, Optional, Union
 
 from fastapi import HTTPException
 import openai
@@ -15,6 +16,17 @@ from app.schemas.chat import (
     DeltaMessage,
     Usage,
 )
+from app.config import LLMTransportConfig, settings
+from app.core.llm.stream import (
+    SSE_DONE,
+    SSEScanner,
+    StreamEvent,
+    encode_sse,
+    error_events,
+)
+from app.core.llm.transport import get_http_client
+
+logger = logging.getLogger(__name__)
 
 
 class ModelProvider:
@@ -25,10 +37,23 @@ class ModelProvider:
         raise NotImplementedError
 
     async def stream_generate(
+        self, request: ChatCompletionRequest, structured: bool = False
+    ) -> AsyncGenerator[Union[bytes, StreamEvent], None]:
+        """
+        为流式请求生成SSE事件流。
+        structured=False 时只产出编码好的 SSE 字节帧；
+        structured=True 时产出 StreamEvent，同时携带帧字节与解析好的增量字段。
+        """
+        async with aclosing(self.stream_events(request)) as stream:
+            async for event in stream:
+                yield event if structured else event.data
+
+    async def stream_events(
         self, request: ChatCompletionRequest
-    ) -> AsyncGenerator[str, None]:
-        """为流式请求生成SSE事件流"""
+    ) -> AsyncGenerator[StreamEvent, None]:
+        """为流式请求生成结构化事件流，子类需实现此方法"""
         raise NotImplementedError
+        yield
 
 
 class LocalEchoProvider(ModelProvider):
@@ -62,9 +87,9 @@ class LocalEchoProvider(ModelProvider):
             ),
         )
 
-    async def stream_generate(
+    async def stream_events(
         self, request: ChatCompletionRequest
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[StreamEvent, None]:
         """模拟流式回显"""
         last_user_msg = next(
             (m for m in reversed(request.messages) if m.role == "user"), None
@@ -86,7 +111,9 @@ class LocalEchoProvider(ModelProvider):
                 )
             ],
         )
-        yield f"data: {first_chunk.model_dump_json()}\n\n"
+        yield StreamEvent(
+            data=encode_sse(first_chunk.model_dump_json(exclude_none=True))
+        )
         await asyncio.sleep(0.1)
 
         # 2. 逐字发送内容
@@ -102,7 +129,10 @@ class LocalEchoProvider(ModelProvider):
                     )
                 ],
             )
-            yield f"data: {chunk.model_dump_json()}\n\n"
+            yield StreamEvent(
+                data=encode_sse(chunk.model_dump_json(exclude_none=True)),
+                content=char,
+            )
             await asyncio.sleep(0.05)
 
         # 3. 发送结束标志
@@ -116,26 +146,59 @@ class LocalEchoProvider(ModelProvider):
                 )
             ],
         )
-        yield f"data: {end_chunk.model_dump_json()}\n\n"
+        yield StreamEvent(
+            data=encode_sse(end_chunk.model_dump_json(exclude_none=True)),
+            finish_reason="stop",
+        )
 
         # 4. 发送SSE结束信号
-        yield "data: [DONE]\n\n"
+        yield StreamEvent(data=SSE_DONE)
 
 
 class OpenAIProvider(ModelProvider):
     """OpenAI API的模型提供者"""
 
-    def __init__(self, api_key: Optional[str] = None):
-        # 使用环境变量或直接传入的api_key
-        self.client = openai.AsyncOpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
-        if not self.client.api_key:
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        passthrough: Optional[bool] = None,
+        *,
+        name: str = "openai",
+        base_url: Optional[str] = None,
+        transport: Optional[LLMTransportConfig] = None,
+    ):
+        self.name = name
+        self.transport = transport or settings.OPENAI_TRANSPORT
+        # 同一提供者的所有实例共享一个连接池
+        self._http_client = get_http_client(name, self.transport)
+        self._client = openai.AsyncOpenAI(
+            api_key=api_key or settings.OPENAI_API_KEY,
+            base_url=base_url or settings.OPENAI_BASE_URL,
+            http_client=self._http_client,
+        )
+        if not self._client.api_key:
             raise ValueError(
                 "OpenAI API key is not provided. Please set the OPENAI_API_KEY environment variable or pass it during initialization."
             )
+        self.passthrough = (
+            settings.LLM_STREAM_PASSTHROUGH if passthrough is None else passthrough
+        )
+
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        """
+        连接池被 close_http_clients 关闭后（例如 Celery 任务结束时的事件循环清理），
+        换用重新创建的连接池。
+        """
+        http_client = get_http_client(self.name, self.transport)
+        if http_client is not self._http_client:
+            self._http_client = http_client
+            self._client = self._client.copy(http_client=http_client)
+        return self._client
 
     def _prepare_payload(self, request: ChatCompletionRequest) -> dict:
         """准备发送给OpenAI API的载荷"""
-        return {
+        payload = {
             "model": request.model,
             "messages": [
                 {"role": m.role, "content": m.content} for m in request.messages
@@ -147,6 +210,10 @@ class OpenAIProvider(ModelProvider):
             "stop": request.stop,
             "stream": request.stream,
         }
+        if request.stream and settings.LLM_STREAM_INCLUDE_USAGE:
+            # 要求上游在最后一个 chunk 中返回用量
+            payload["stream_options"] = {"include_usage": True}
+        return payload
 
     async def generate(self, request: ChatCompletionRequest) -> ChatCompletionResponse:
         """调用OpenAI API获取完整响应 (非流式)"""
@@ -155,14 +222,21 @@ class OpenAIProvider(ModelProvider):
 
         try:
             res = await self.client.chat.completions.create(**payload)
-            return ChatCompletionResponse.model_validate(res)
+            return ChatCompletionResponse.model_validate(res.model_dump())
         except openai.APIError as e:
-            raise HTTPException(status_code=e.status_code, detail=e.message)
+            raise HTTPException(
+                status_code=getattr(e, "status_code", 502), detail=e.message
+            )
 
-    async def stream_generate(
+    async def stream_events(
         self, request: ChatCompletionRequest
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[StreamEvent, None]:
         """调用OpenAI API并以SSE格式流式返回响应"""
+        if self.passthrough:
+            async for event in self._stream_passthrough(request):
+                yield event
+            return
+
         request.stream = True
         payload = self._prepare_payload(request)
 
@@ -174,29 +248,65 @@ class OpenAIProvider(ModelProvider):
                 sse_chunk = ChatCompletionStreamResponse.model_validate(
                     chunk.model_dump()
                 )
-                yield f"data: {sse_chunk.model_dump_json(exclude_none=True)}\n\n"
+                event = StreamEvent(
+                    data=encode_sse(sse_chunk.model_dump_json(exclude_none=True)),
+                    usage=sse_chunk.usage,
+                )
+                if sse_chunk.choices:
+                    choice = sse_chunk.choices[0]
+                    event.content = choice.delta.content
+                    event.finish_reason = choice.finish_reason
+                yield event
 
             # OpenAI的Python SDK在结束后会自动处理，但为了兼容性，我们手动发送[DONE]
-            yield "data: [DONE]\n\n"
+            yield StreamEvent(data=SSE_DONE)
         except openai.APIError as e:
             # 在流中处理错误可能比较棘手，这里我们简单地记录并停止
             print(f"An error occurred during streaming: {e}")
-            # 可以在这里yield一个错误格式的SSE事件
-            error_message = {"error": {"code": e.status_code, "message": e.message}}
-            import json
+            # 以错误格式的SSE事件通知客户端
+            for event in error_events(getattr(e, "status_code", 502), e.message):
+                yield event
+
+    async def _stream_passthrough(
+        self, request: ChatCompletionRequest
+    ) -> AsyncGenerator[StreamEvent, None]:
+        """
+        直通模式：将上游的 SSE 原始字节流原样转发，
+        仅通过 SSEScanner 提取需要持久化的字段，避免逐 token 的 pydantic 往返。
+        """
+        request.stream = True
+        payload = self._prepare_payload(request)
+        scanner = SSEScanner()
+
+        try:
+            async with self.client.chat.completions.with_streaming_response.create(
+                **payload
+            ) as response:
+                async for raw in response.iter_bytes():
+                    for event in scanner.feed(raw):
+                        yield event
+            for event in scanner.flush():
+                yield event
 
-            yield f"data: {json.dumps(error_message)}\n\n"
-            yield "data: [DONE]\n\n"
+            if not scanner.done:
+                yield StreamEvent(data=SSE_DONE)
+        except openai.APIError as e:
+            logger.error(f"{self.name} passthrough stream failed: {e}")
+            for event in error_events(getattr(e, "status_code", 502), e.message):
+                yield event
 
 
 class SiliconflowProvider(OpenAIProvider):
 
     def __init__(self):
-        # 使用环境变量或直接传入的api_key
-        self.client = openai.AsyncOpenAI(
-            base_url="https://api.siliconflow.cn/v1",
-            api_key="sk-ekppvtvqrksaqhkgbeseodmgmcrwtekivxyswmufmbodxfnp",
+        # 不回退到 OPENAI_API_KEY，避免把 OpenAI 的密钥发给其他服务商
+        if not settings.SILICONFLOW_API_KEY:
+            raise ValueError(
+                "SiliconFlow API key is not provided. Please set the SILICONFLOW_API_KEY environment variable."
+            )
+        super().__init__(
+            api_key=settings.SILICONFLOW_API_KEY,
+            name="siliconflow",
+            base_url=settings.SILICONFLOW_BASE_URL,
+            transport=settings.SILICONFLOW_TRANSPORT,
         )
-
-
-llm_provider = SiliconflowProvider()
@@ -0,0 +1,400 @@
+import asyncio
+from collections import deque
+from contextlib import suppress
+import logging
+import random
+import time
+from typing import AsyncGenerator, Callable, Dict, List, Optional
+
+from fastapi import HTTPException, status
+
+from app.config import settings
+from app.core.llm.llm import (
+    LocalEchoProvider,
+    ModelProvider,
+    OpenAIProvider,
+    SiliconflowProvider,
+)
+from app.core.llm.stream import SSE_DONE, StreamEvent, error_events
+from app.core.metrics import metrics
+from app.schemas.chat import ChatCompletionRequest, ChatCompletionResponse
+
+logger = logging.getLogger(__name__)
+
+
+def is_retryable(code: Optional[int]) -> bool:
+    """上游错误是否应计入后端故障并切换到其他后端"""
+    return code is None or code >= 500 or code in (408, 429)
+
+
+class CircuitBreaker:
+    """
+    熔断器。
+    连续失败达到阈值后打开，冷却 recovery_time 秒后进入半开状态，
+    半开状态只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_time: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._probe_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self.opened_at < self.recovery_time:
+                return False
+            self.state = self.HALF_OPEN
+            self._probing = False
+        # 探测请求可能被客户端中断而没有结果，超时后允许重新探测
+        if self._probing and now - self._probe_at < self.recovery_time:
+            return False
+        self._probing = True
+        self._probe_at = now
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def release_probe(self):
+        """探测请求没有得出结论（如请求本身无效），允许重新探测，不改变状态"""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class Backend:
+    """
+    路由中的一个上游后端，记录首包延迟与错误率的 EWMA，
+    并按请求类型保留最近的延迟样本用于计算对冲延迟的分位数。
+    """
+
+    def __init__(self, name: str, provider: ModelProvider):
+        self.name = name
+        self.provider = provider
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples: Dict[str, deque] = {
+            "stream": deque(maxlen=256),
+            "generate": deque(maxlen=256),
+        }
+        self.breaker = CircuitBreaker(
+            settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+            settings.LLM_CIRCUIT_RECOVERY_SECONDS,
+        )
+
+    def record_success(self, latency: float, kind: str = "stream"):
+        self.samples[kind].append(latency)
+        alpha = settings.LLM_ROUTER_EWMA_ALPHA
+        self.latency = (
+            latency
+            if self.latency is None
+            else alpha * latency + (1 - alpha) * self.latency
+        )
+        self.error_rate = (1 - alpha) * self.error_rate
+        slow = settings.LLM_CIRCUIT_SLOW_SECONDS
+        if slow and latency > slow:
+            # 过慢的响应同样计入熔断
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        metrics.observe("llm_backend_ttft_seconds", latency, backend=self.name)
+
+    def record_neutral(self):
+        """
+        不可重试的上游错误（如 400）由请求本身导致，不反映后端健康状况，
+        既不计入延迟与错误率，也不计入熔断。
+        """
+        self.breaker.release_probe()
+        metrics.incr("llm_backend_rejected", backend=self.name)
+
+    def record_failure(self):
+        alpha = settings.LLM_ROUTER_EWMA_ALPHA
+        self.error_rate = alpha + (1 - alpha) * self.error_rate
+        self.breaker.record_failure()
+        metrics.incr("llm_backend_errors", backend=self.name)
+
+    def hedge_delay(self, kind: str) -> float:
+        """按最近延迟样本的分位数计算对冲延迟，样本不足时使用默认值"""
+        samples = self.samples[kind]
+        if len(samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return settings.LLM_HEDGE_DEFAULT_DELAY
+        ordered = sorted(samples)
+        idx = min(
+            int(len(ordered) * settings.LLM_HEDGE_PERCENTILE / 100), len(ordered) - 1
+        )
+        return max(ordered[idx], settings.LLM_HEDGE_MIN_DELAY)
+
+    def weight(self, default_latency: float) -> float:
+        latency = self.latency if self.latency is not None else default_latency
+        return (1 - self.error_rate) / max(latency, 1e-3)
+
+    def stats(self) -> dict:
+        return {
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "circuit": self.breaker.state,
+        }
+
+
+class RouterProvider(ModelProvider):
+    """
+    多后端路由模型提供者。
+    按模型配置候选后端，按 EWMA 首包延迟和错误率加权随机选择健康后端，
+    熔断打开的后端不再接收流量；请求失败且尚未向客户端输出内容时切换到下一个后端。
+    开启 LLM_HEDGE_ENABLED 后，首包迟迟未到的请求会向同一或其他后端发起对冲请求。
+    """
+
+    def __init__(self, routes: Dict[str, List[str]], default: List[str]):
+        self.routes = routes
+        self.default = default
+        self.backends: Dict[str, Backend] = {}
+        for name in {n for names in [default, *routes.values()] for n in names}:
+            factory = self.get_provider_factory(name)
+            try:
+                provider = factory()
+            except ValueError as e:
+                # 未配置的后端（如缺少 API key）不参与路由，全部不可用时请求返回 503
+                logger.warning(f"llm backend {name} disabled: {e}")
+                continue
+            self.backends[name] = Backend(name, provider)
+        metrics.gauge(
+            "llm_backends",
+            lambda: {name: b.stats() for name, b in self.backends.items()},
+        )
+
+    @staticmethod
+    def get_provider_factory(name: str) -> Callable[[], ModelProvider]:
+        match name:
+            case "local":
+                return LocalEchoProvider
+            case "synthetic":
+                from app.core.llm.synthetic import SyntheticProvider
+
+                return SyntheticProvider
+            case "openai":
+                return OpenAIProvider
+            case "siliconflow":
+                return SiliconflowProvider
+            case _:
+                raise ValueError(f"unsupported llm backend {name}")
+
+    @classmethod
+    def from_settings(cls) -> "RouterProvider":
+        return cls(settings.LLM_ROUTES, settings.LLM_DEFAULT_BACKENDS)
+
+    def candidates(self, model: Optional[str]) -> List[Backend]:
+        names = self.routes.get(model or "", self.default)
+        return [self.backends[name] for name in names if name in self.backends]
+
+    def select(self, model: Optional[str], exclude: set) -> Optional[Backend]:
+        """在健康后端中按权重随机选择一个"""
+        candidates = [b for b in self.candidates(model) if b.name not in exclude]
+        known = [b.latency for b in candidates if b.latency is not None]
+        # 尚无样本的后端按已知最快延迟估计，保证新后端能获得流量
+        default_latency = min(known) if known else 1.0
+        # allow() 会占用半开状态的探测名额，因此按权重逐个抽取后再询问
+        weighted = [(b.weight(default_latency), b) for b in candidates]
+        while weighted:
+            total = sum(w for w, _ in weighted)
+            pick = random.uniform(0, total)
+            for i, (w, backend) in enumerate(weighted):
+                pick -= w
+                if pick <= 0 or i == len(weighted) - 1:
+                    break
+            weighted.pop(i)
+            if backend.breaker.allow():
+                return backend
+        return None
+
+    def hedge_backend(
+        self, model: Optional[str], tried: set, primary: Backend
+    ) -> Optional[Backend]:
+        """选择对冲请求的后端：优先其他健康后端，否则使用同一个后端"""
+        backend = self.select(model, tried)
+        if backend is None and primary.breaker.state == CircuitBreaker.CLOSED:
+            backend = primary
+        if backend is not None:
+            tried.add(backend.name)
+            metrics.incr("llm_hedge_total", backend=backend.name)
+        return backend
+
+    async def _race_generate(
+        self, backend: Backend, request: ChatCompletionRequest, tried: set
+    ) -> ChatCompletionResponse:
+        """
+        调用 backend 获取完整响应。开启对冲时，若超过对冲延迟仍未返回，
+        再发起一个相同请求，取先成功者并取消另一个。
+        """
+        start = time.monotonic()
+        tasks = {asyncio.create_task(backend.provider.generate(request)): backend}
+        delay = backend.hedge_delay("generate") if settings.LLM_HEDGE_ENABLED else None
+        hedge_task = None
+        last_error: Optional[HTTPException] = None
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(
+                    tasks, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    delay = None
+                    hedge = self.hedge_backend(request.model, tried, backend)
+                    if hedge is not None:
+                        hedge_task = asyncio.create_task(
+                            hedge.provider.generate(request)
+                        )
+                        tasks[hedge_task] = hedge
+                    continue
+                for task in done:
+                    b = tasks.pop(task)
+                    try:
+                        response = task.result()
+                    except HTTPException as e:
+                        if not is_retryable(e.status_code):
+                            b.record_neutral()
+                            raise
+                        b.record_failure()
+                        last_error = e
+                        continue
+                    b.record_success(time.monotonic() - start, "generate")
+                    if task is hedge_task:
+                        metrics.incr("llm_hedge_wins", backend=b.name)
+                    return response
+            raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _race_stream(
+        self, backend: Backend, request: ChatCompletionRequest, tried: set
+    ) -> tuple[Optional[Backend], AsyncGenerator, list[StreamEvent]]:
+        """
+        打开 backend 的事件流并等待首个事件。开启对冲时，若超过对冲延迟仍无首包，
+        再发起一个相同请求，使用先产出有效首包的流并关闭另一个。
+        成功时返回 (后端, 事件流, [首个事件])，全部失败时返回 (None, None, 错误帧)。
+        """
+        start = time.monotonic()
+        attempts: Dict[asyncio.Future, tuple[Backend, AsyncGenerator]] = {}
+
+        def launch(b: Backend) -> asyncio.Future:
+            stream = b.provider.stream_events(request)
+            task = asyncio.ensure_future(anext(stream))
+            attempts[task] = (b, stream)
+            return task
+
+        launch(backend)
+        delay = backend.hedge_delay("stream") if settings.LLM_HEDGE_ENABLED else None
+        hedge_task = None
+        error: list[StreamEvent] = []
+        try:
+            while attempts:
+                done, _ = await asyncio.wait(
+                    attempts, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    delay = None
+                    hedge = self.hedge_backend(request.model, tried, backend)
+                    if hedge is not None:
+                        hedge_task = launch(hedge)
+                    continue
+                for task in done:
+                    b, stream = attempts.pop(task)
+                    try:
+                        event = task.result()
+                    except StopAsyncIteration:
+                        event = None
+                    except Exception:
+                        logger.exception(f"llm backend {b.name} raised")
+                        event = None
+                    if event is None or (
+                        event.error is not None and is_retryable(event.error)
+                    ):
+                        # 尚未输出任何内容，丢弃错误帧，由调用方切换后端
+                        b.record_failure()
+                        await stream.aclose()
+                        if event is not None:
+                            error = [event, StreamEvent(data=SSE_DONE)]
+                        continue
+                    if event.error is not None:
+                        # 不可重试的错误原样返回给客户端
+                        b.record_neutral()
+                        return b, stream, [event]
+                    b.record_success(time.monotonic() - start, "stream")
+                    if task is hedge_task:
+                        metrics.incr("llm_hedge_wins", backend=b.name)
+                    return b, stream, [event]
+            return None, None, error
+        finally:
+            for task, (b, stream) in attempts.items():
+                task.cancel()
+                with suppress(BaseException):
+                    await task
+                await stream.aclose()
+
+    async def generate(self, request: ChatCompletionRequest) -> ChatCompletionResponse:
+        tried = set()
+        last_error: Optional[Exception] = None
+        while (backend := self.select(request.model, tried)) is not None:
+            tried.add(backend.name)
+            try:
+                return await self._race_generate(backend, request, tried)
+            except HTTPException as e:
+                if not is_retryable(e.status_code):
+                    raise
+                last_error = e
+            logger.warning(f"llm backend {backend.name} failed, failing over")
+
+        if last_error:
+            raise last_error
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No available llm backend",
+        )
+
+    async def stream_events(
+        self, request: ChatCompletionRequest
+    ) -> AsyncGenerator[StreamEvent, None]:
+        tried = set()
+        last_error: list[StreamEvent] = []
+        while (backend := self.select(request.model, tried)) is not None:
+            tried.add(backend.name)
+            winner, stream, events = await self._race_stream(backend, request, tried)
+            if winner is None:
+                last_error = events or last_error
+                logger.warning(f"llm backend {backend.name} failed, failing over")
+                continue
+
+            try:
+                yield events[0]
+                async for event in stream:
+                    if event.error is not None and is_retryable(event.error):
+                        winner.record_failure()
+                    yield event
+            except Exception:
+                winner.record_failure()
+                raise
+            finally:
+                await stream.aclose()
+            return
+
+        for event in last_error or error_events(
+            status.HTTP_503_SERVICE_UNAVAILABLE, "No available llm backend"
+        ):
+            yield event
@@ -0,0 +1,135 @@
+import asyncio
+from contextlib import aclosing
+import logging
+from typing import AsyncGenerator, AsyncIterator, Dict, List, Optional
+
+from app.config import settings
+from app.core.llm.cache import cache_key
+from app.core.llm.llm import ModelProvider
+from app.core.llm.stream import StreamEvent
+from app.core.metrics import metrics
+from app.schemas.chat import ChatCompletionRequest, ChatCompletionResponse
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """
+    一次共享的上游流式生成。
+    生产者把事件追加到 events，订阅者各自从头读取，因此晚加入的订阅者也能拿到完整事件序列。
+    所有订阅者都离开后取消上游生成。
+    """
+
+    def __init__(self, key: str, source: AsyncIterator[StreamEvent], on_close):
+        self.key = key
+        self.events: List[StreamEvent] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_close = on_close
+        self._task = asyncio.create_task(self._run(source))
+
+    async def _run(self, source: AsyncIterator[StreamEvent]):
+        try:
+            async for event in source:
+                self.events.append(event)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            self._on_close(self)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncGenerator[StreamEvent, None]:
+        self.subscribers += 1
+        i = 0
+        try:
+            while True:
+                while i < len(self.events):
+                    yield self.events[i]
+                    i += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # 没有订阅者了，停止上游生成，并立即摘除，避免新请求订阅到被取消的生成
+                self._on_close(self)
+                self._task.cancel()
+
+
+class SingleFlightProvider(ModelProvider):
+    """
+    合并相同的进行中请求。
+    与已有进行中请求相同的请求不再访问上游，而是订阅同一次生成；
+    非流式请求共享同一个结果。
+    """
+
+    def __init__(self, provider: ModelProvider):
+        self.provider = provider
+        self._flights: Dict[str, Flight] = {}
+        self._calls: Dict[str, asyncio.Task] = {}
+        metrics.gauge(
+            "llm_singleflight_inflight",
+            lambda: {"stream": len(self._flights), "generate": len(self._calls)},
+        )
+
+    def shareable(self, request: ChatCompletionRequest) -> bool:
+        if request.n not in (None, 1):
+            return False
+        return (
+            not settings.LLM_SINGLE_FLIGHT_DETERMINISTIC_ONLY
+            or request.temperature == 0
+        )
+
+    async def generate(self, request: ChatCompletionRequest) -> ChatCompletionResponse:
+        if not self.shareable(request):
+            return await self.provider.generate(request)
+
+        key = cache_key(request)
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.create_task(
+                self.provider.generate(request)
+            )
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            metrics.incr("llm_singleflight_joined", kind="generate")
+        # shield 避免某个调用方被取消时连带取消共享的上游请求
+        response = await asyncio.shield(task)
+        return response.model_copy(deep=True)
+
+    def _close(self, flight: Flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    async def stream_events(
+        self, request: ChatCompletionRequest
+    ) -> AsyncGenerator[StreamEvent, None]:
+        if not self.shareable(request):
+            async with aclosing(self.provider.stream_events(request)) as stream:
+                async for event in stream:
+                    yield event
+            return
+
+        key = cache_key(request)
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = Flight(
+                key, self.provider.stream_events(request), self._close
+            )
+        else:
+            metrics.incr("llm_singleflight_joined", kind="stream")
+
+        async with aclosing(flight.subscribe()) as subscription:
+            async for event in subscription:
+                yield event
@@ -0,0 +1,170 @@
+from dataclasses import dataclass
+import json
+from json.decoder import scanstring
+from typing import Optional
+
+from app.schemas.chat import (
+    ChatCompletionResponse,
+    ChatCompletionStreamChoice,
+    ChatCompletionStreamResponse,
+    DeltaMessage,
+    Usage,
+)
+
+SSE_DONE = b"data: [DONE]\n\n"
+
+_decoder = json.JSONDecoder()
+
+
+def encode_sse(payload: str) -> bytes:
+    """将 JSON 字符串编码为一个 SSE data 帧"""
+    return b"data: " + payload.encode() + b"\n\n"
+
+
+@dataclass(slots=True)
+class StreamEvent:
+    """
+    结构化流式事件。
+    data 为已编码好的 SSE 帧，可直接写给客户端；
+    content / finish_reason / usage 为同一帧中需要持久化的字段，消费方无需再解析 JSON。
+    error 为错误帧对应的状态码，正常帧为 None。
+    """
+
+    data: bytes
+    content: Optional[str] = None
+    finish_reason: Optional[str] = None
+    usage: Optional[Usage] = None
+    error: Optional[int] = None
+
+
+def error_events(code: int, message: str) -> list[StreamEvent]:
+    """构造错误帧及随后的结束帧"""
+    error_message = {"error": {"code": code, "message": message}}
+    return [
+        StreamEvent(data=encode_sse(json.dumps(error_message)), error=code),
+        StreamEvent(data=SSE_DONE),
+    ]
+
+
+def _scan_string(text: str, key: str, start: int) -> Optional[str]:
+    """在 text 中查找 key 并解码其后的 JSON 字符串值，值为 null 或不存在时返回 None"""
+    idx = text.find(key, start)
+    if idx == -1:
+        return None
+    idx += len(key)
+    while idx < len(text) and text[idx] in " \t":
+        idx += 1
+    if not text.startswith('"', idx):
+        return None
+    value, _ = scanstring(text, idx + 1)
+    return value
+
+
+class SSEScanner:
+    """
+    增量 SSE 扫描器。
+    按帧切分上游原始字节流，帧字节原样保留用于转发，
+    只从中提取需要持久化的 content / finish_reason / usage 字段，不做完整的 JSON 解析。
+    多个 choice 时只取第一个出现的字段。
+    行结束符 CRLF / CR 统一为 LF 后再切分，转发的帧使用 LF。
+    """
+
+    __slots__ = ("_buffer", "_cr", "done")
+
+    def __init__(self):
+        self._buffer = b""
+        # 上一段以 CR 结尾，需要与下一段开头的 LF 一起判断
+        self._cr = False
+        self.done = False
+
+    def _normalize(self, chunk: bytes) -> bytes:
+        if self._cr:
+            chunk = b"\r" + chunk
+            self._cr = False
+        if chunk.endswith(b"\r"):
+            chunk = chunk[:-1]
+            self._cr = True
+        if b"\r" in chunk:
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        return chunk
+
+    def feed(self, chunk: bytes) -> list[StreamEvent]:
+        """喂入一段原始字节，返回其中已完整的帧"""
+        chunk = self._normalize(chunk)
+        buffer = self._buffer + chunk if self._buffer else chunk
+        events = []
+        start = 0
+        while (end := buffer.find(b"\n\n", start)) != -1:
+            end += 2
+            events.append(self._scan(buffer[start:end]))
+            start = end
+        self._buffer = buffer[start:]
+        return events
+
+    def flush(self) -> list[StreamEvent]:
+        """上游结束后处理缓冲区中残留的不完整帧"""
+        if self._cr:
+            self._buffer += b"\n"
+            self._cr = False
+        if not self._buffer.strip():
+            return []
+        frame, self._buffer = self._buffer + b"\n\n", b""
+        return [self._scan(frame)]
+
+    def _scan(self, frame: bytes) -> StreamEvent:
+        event = StreamEvent(data=frame)
+        text = frame.decode()
+        pos = text.find("data:")
+        if pos == -1:
+            # 注释或心跳帧，原样转发
+            return event
+        pos += len("data:")
+        if text[pos:].strip() == "[DONE]":
+            self.done = True
+            return event
+
+        event.content = _scan_string(text, '"content":', pos)
+        event.finish_reason = _scan_string(text, '"finish_reason":', pos)
+        idx = text.find('"usage":', pos)
+        if idx != -1:
+            idx += len('"usage":')
+            while idx < len(text) and text[idx] in " \t":
+                idx += 1
+            if text.startswith("{", idx):
+                usage, _ = _decoder.raw_decode(text, idx)
+                event.usage = Usage.model_validate(usage)
+        return event
+
+
+def completion_to_events(
+    response: ChatCompletionResponse, chunk_size: int = 64
+) -> list[StreamEvent]:
+    """将完整响应还原为与上游格式一致的 SSE 事件序列，用于缓存回放"""
+    choice = response.choices[0]
+    content = choice.message.content or ""
+
+    def frame(delta: DeltaMessage, finish_reason: Optional[str] = None) -> bytes:
+        chunk = ChatCompletionStreamResponse(
+            id=response.id,
+            created=response.created,
+            model=response.model,
+            choices=[
+                ChatCompletionStreamChoice(
+                    index=0, delta=delta, finish_reason=finish_reason
+                )
+            ],
+        )
+        return encode_sse(chunk.model_dump_json(exclude_none=True))
+
+    events = [StreamEvent(data=frame(DeltaMessage(role="assistant")))]
+    for i in range(0, len(content), chunk_size):
+        part = content[i : i + chunk_size]
+        events.append(StreamEvent(data=frame(DeltaMessage(content=part)), content=part))
+    events.append(
+        StreamEvent(
+            data=frame(DeltaMessage(), choice.finish_reason),
+            finish_reason=choice.finish_reason,
+        )
+    )
+    events.append(StreamEvent(data=SSE_DONE))
+    return events
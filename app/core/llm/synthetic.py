@@ -0,0 +1,255 @@
+"""
+合成 LLM 后端。
+
+SyntheticProvider 为进程内的模型提供者，可在路由中以 "synthetic" 名称使用；
+create_stub_app 提供一个 OpenAI 兼容的 HTTP 桩服务，便于在没有外部服务的情况下压测
+OpenAIProvider 的真实网络路径：
+
+    python -m app.core.llm.synthetic --port 9000
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=sk-synthetic ...
+
+行为由 Settings.SYNTHETIC_LLM 配置，例如 SYNTHETIC_LLM__TTFT_MS=500。
+"""
+
+import argparse
+import asyncio
+from dataclasses import dataclass
+import random
+import time
+import uuid
+from typing import AsyncGenerator, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.config import SyntheticLLMConfig, settings
+from app.core.llm.llm import ModelProvider
+from app.core.llm.stream import SSE_DONE, StreamEvent, encode_sse, error_events
+from app.core.llm.tokens import estimate_prompt_tokens
+from app.schemas.chat import (
+    ChatCompletionChoice,
+    ChatCompletionRequest,
+    ChatCompletionResponse,
+    ChatCompletionStreamChoice,
+    ChatCompletionStreamResponse,
+    ChatMessage,
+    DeltaMessage,
+    Usage,
+)
+
+_WORDS = (
+    "the quick brown fox jumps over a lazy dog while synthetic tokens stream "
+    "steadily through the pipeline so that latency and throughput can be measured"
+).split()
+
+
+def sample(rng: random.Random, mean: float, distribution: str, spread: float) -> float:
+    """按指定分布采样一个非负值，mean 为均值（lognormal 为中位数）"""
+    match distribution:
+        case "fixed":
+            value = mean
+        case "uniform":
+            value = rng.uniform(mean * (1 - spread), mean * (1 + spread))
+        case "normal":
+            value = rng.gauss(mean, mean * spread)
+        case "lognormal":
+            value = mean * rng.lognormvariate(0, spread)
+        case "exponential":
+            value = rng.expovariate(1 / mean) if mean > 0 else 0
+        case _:
+            raise ValueError(f"unsupported distribution {distribution}")
+    return max(value, 0.0)
+
+
+@dataclass
+class SyntheticPlan:
+    """一次合成响应的执行计划"""
+
+    ttft: float
+    tokens: List[str]
+    delays: List[float]
+    finish_reason: str
+    # 首包前失败时返回的状态码
+    fail_status: Optional[int] = None
+    # 输出到第几个 token 时中途失败
+    fail_at: Optional[int] = None
+
+
+class SyntheticProvider(ModelProvider):
+    """可配置首包延迟、输出速率、延迟分布、错误注入与响应长度的合成模型提供者"""
+
+    def __init__(self, config: Optional[SyntheticLLMConfig] = None):
+        self.config = config or settings.SYNTHETIC_LLM
+        self.rng = random.Random(self.config.seed)
+
+    def plan(self, request: ChatCompletionRequest) -> SyntheticPlan:
+        config = self.config
+        rng = self.rng
+        ttft = (
+            sample(rng, config.ttft_ms, config.ttft_distribution, config.ttft_spread)
+            / 1000
+        )
+        if rng.random() < config.error_rate:
+            return SyntheticPlan(
+                ttft=ttft,
+                tokens=[],
+                delays=[],
+                finish_reason="error",
+                fail_status=config.error_status,
+            )
+
+        count = rng.randint(config.response_tokens_min, config.response_tokens_max)
+        finish_reason = "stop"
+        if request.max_tokens is not None and count > request.max_tokens:
+            count = request.max_tokens
+            finish_reason = "length"
+        offset = rng.randrange(len(_WORDS))
+        tokens = [_WORDS[(offset + i) % len(_WORDS)] + " " for i in range(count)]
+        interval = 1 / config.tokens_per_second
+        delays = [
+            sample(rng, interval, config.token_distribution, config.token_spread)
+            for _ in range(count)
+        ]
+        fail_at = None
+        if count and rng.random() < config.stream_error_rate:
+            fail_at = rng.randrange(count)
+        return SyntheticPlan(
+            ttft=ttft,
+            tokens=tokens,
+            delays=delays,
+            finish_reason=finish_reason,
+            fail_at=fail_at,
+        )
+
+    def usage(self, request: ChatCompletionRequest, plan: SyntheticPlan) -> Usage:
+        prompt_tokens = estimate_prompt_tokens(request.messages)
+        return Usage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=len(plan.tokens),
+            total_tokens=prompt_tokens + len(plan.tokens),
+        )
+
+    def completion(
+        self, request: ChatCompletionRequest, plan: SyntheticPlan
+    ) -> ChatCompletionResponse:
+        return ChatCompletionResponse(
+            id=f"synthetic-{uuid.uuid4().hex}",
+            created=int(time.time()),
+            model=request.model or "synthetic",
+            choices=[
+                ChatCompletionChoice(
+                    index=0,
+                    message=ChatMessage(role="assistant", content="".join(plan.tokens)),
+                    finish_reason=plan.finish_reason,
+                )
+            ],
+            usage=self.usage(request, plan),
+        )
+
+    async def generate(self, request: ChatCompletionRequest) -> ChatCompletionResponse:
+        plan = self.plan(request)
+        await asyncio.sleep(plan.ttft)
+        if plan.fail_status is not None:
+            raise HTTPException(
+                status_code=plan.fail_status, detail="synthetic upstream error"
+            )
+        await asyncio.sleep(sum(plan.delays))
+        return self.completion(request, plan)
+
+    async def stream_events(
+        self, request: ChatCompletionRequest
+    ) -> AsyncGenerator[StreamEvent, None]:
+        async for event in self.play(request, self.plan(request)):
+            yield event
+
+    async def play(
+        self, request: ChatCompletionRequest, plan: SyntheticPlan
+    ) -> AsyncGenerator[StreamEvent, None]:
+        """按计划输出 OpenAI 格式的流式事件"""
+        await asyncio.sleep(plan.ttft)
+        if plan.fail_status is not None:
+            for event in error_events(plan.fail_status, "synthetic upstream error"):
+                yield event
+            return
+
+        resp_id = f"synthetic-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = request.model or "synthetic"
+
+        def frame(
+            delta: DeltaMessage,
+            finish_reason: Optional[str] = None,
+            usage: Optional[Usage] = None,
+        ) -> bytes:
+            chunk = ChatCompletionStreamResponse(
+                id=resp_id,
+                created=created,
+                model=model,
+                choices=[
+                    ChatCompletionStreamChoice(
+                        index=0, delta=delta, finish_reason=finish_reason
+                    )
+                ],
+                usage=usage,
+            )
+            return encode_sse(chunk.model_dump_json(exclude_none=True))
+
+        yield StreamEvent(data=frame(DeltaMessage(role="assistant")))
+        for i, (token, delay) in enumerate(zip(plan.tokens, plan.delays)):
+            if i == plan.fail_at:
+                for event in error_events(502, "synthetic stream interrupted"):
+                    yield event
+                return
+            yield StreamEvent(data=frame(DeltaMessage(content=token)), content=token)
+            await asyncio.sleep(delay)
+
+        usage = self.usage(request, plan)
+        yield StreamEvent(
+            data=frame(DeltaMessage(), plan.finish_reason, usage),
+            finish_reason=plan.finish_reason,
+            usage=usage,
+        )
+        yield StreamEvent(data=SSE_DONE)
+
+
+def create_stub_app(config: Optional[SyntheticLLMConfig] = None) -> FastAPI:
+    """OpenAI 兼容的合成 LLM 桩服务"""
+    provider = SyntheticProvider(config)
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: ChatCompletionRequest):
+        plan = provider.plan(request)
+        if plan.fail_status is not None:
+            # 首包前失败以 HTTP 错误返回，与真实上游一致
+            await asyncio.sleep(plan.ttft)
+            return JSONResponse(
+                status_code=plan.fail_status,
+                content={
+                    "error": {
+                        "message": "synthetic upstream error",
+                        "type": "server_error",
+                    }
+                },
+            )
+        if request.stream:
+            return StreamingResponse(
+                (event.data async for event in provider.play(request, plan)),
+                media_type="text/event-stream",
+            )
+
+        await asyncio.sleep(plan.ttft + sum(plan.delays))
+        return provider.completion(request, plan)
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible synthetic LLM stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+
+    uvicorn.run(create_stub_app(), host=args.host, port=args.port, log_level="warning")
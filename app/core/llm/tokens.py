@@ -0,0 +1,54 @@
+import re
+from typing import Any, List, Optional
+
+from app.schemas.chat import ChatCompletionRequest, ChatMessage, Usage
+
+# 每条消息在对话模板中的额外开销（角色、分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+
+def content_text(content: Any) -> str:
+    """提取消息 content 中的文本，多模态内容只取 text 部分"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            item.get("text", "")
+            for item in content
+            if isinstance(item, dict) and item.get("type") == "text"
+        )
+    return ""
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：CJK 字符按一个 token 计，其余按每 4 个字符一个 token 计"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_prompt_tokens(messages: List[ChatMessage]) -> int:
+    return sum(
+        estimate_tokens(content_text(m.content)) + MESSAGE_OVERHEAD_TOKENS
+        for m in messages
+    )
+
+
+def complete_usage(
+    request: ChatCompletionRequest, completion: str, usage: Optional[Usage] = None
+) -> Usage:
+    """补全上游未返回的用量字段，缺失部分在本地估算"""
+    prompt_tokens = usage.prompt_tokens if usage else None
+    completion_tokens = usage.completion_tokens if usage else None
+    if prompt_tokens is None:
+        prompt_tokens = estimate_prompt_tokens(request.messages)
+    if completion_tokens is None:
+        completion_tokens = estimate_tokens(completion)
+    return Usage(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
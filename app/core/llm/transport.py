@@ -0,0 +1,150 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+from typing import Dict, Optional, Tuple
+
+import httpcore
+import httpx
+
+from app.config import LLMTransportConfig
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CachingNetworkBackend(httpcore.AsyncNetworkBackend):
+    """
+    带 DNS 缓存的网络后端。
+    建连前按 TTL 缓存域名解析结果，TLS 握手仍使用原始域名做 SNI 与证书校验；
+    同时统计新建连接数，用于观察连接抖动。
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend, name: str, ttl: float):
+        self._backend = backend
+        self._name = name
+        self._ttl = ttl
+        self._cache: Dict[Tuple[str, int], Tuple[str, float]] = {}
+
+    async def _resolve(self, host: str, port: int) -> str:
+        try:
+            ipaddress.ip_address(host)
+            return host
+        except ValueError:
+            pass
+
+        now = time.monotonic()
+        cached = self._cache.get((host, port))
+        if cached and cached[1] > now:
+            return cached[0]
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                host, port, type=socket.SOCK_STREAM
+            )
+        except OSError as e:
+            logger.warning(f"dns resolve {host} failed: {e}")
+            return host
+        address = infos[0][4][0]
+        self._cache[(host, port)] = (address, now + self._ttl)
+        return address
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options=None,
+    ) -> httpcore.AsyncNetworkStream:
+        metrics.incr("llm_http_connections_opened", provider=self._name)
+        if self._ttl > 0:
+            host = await self._resolve(host, port)
+        return await self._backend.connect_tcp(
+            host,
+            port,
+            timeout=timeout,
+            local_address=local_address,
+            socket_options=socket_options,
+        )
+
+    async def connect_unix_socket(
+        self, path: str, timeout: Optional[float] = None, socket_options=None
+    ) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(
+            path, timeout=timeout, socket_options=socket_options
+        )
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # type: ignore[import]  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _build_client(name: str, config: LLMTransportConfig) -> httpx.AsyncClient:
+    http2 = config.http2
+    if http2 and not _http2_available():
+        logger.warning(f"{name}: h2 is not installed, falling back to HTTP/1.1")
+        http2 = False
+
+    transport = httpx.AsyncHTTPTransport(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        retries=config.connect_retries,
+    )
+    # httpx 不支持直接传入 network_backend，这里替换连接池的后端以接入 DNS 缓存与建连统计
+    pool = transport._pool
+    pool._network_backend = CachingNetworkBackend(
+        pool._network_backend, name, config.dns_cache_ttl
+    )
+
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(
+            connect=config.connect_timeout,
+            read=config.read_timeout,
+            write=config.write_timeout,
+            pool=config.pool_timeout,
+        ),
+    )
+
+
+def _pool_stats(client: httpx.AsyncClient) -> dict:
+    pool = client._transport._pool
+    connections = pool.connections
+    idle = sum(1 for c in connections if c.is_idle())
+    return {
+        "connections": len(connections),
+        "active": len(connections) - idle,
+        "idle": idle,
+        "max_connections": pool._max_connections,
+    }
+
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def get_http_client(name: str, config: LLMTransportConfig) -> httpx.AsyncClient:
+    """获取指定提供者共享的连接池客户端，首次调用时创建"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _build_client(name, config)
+        metrics.gauge(f"llm_http_pool{{provider={name}}}", lambda: _pool_stats(client))
+    return client
+
+
+async def close_http_clients():
+    """关闭所有提供者的连接池，之后的 get_http_client 调用会重新创建"""
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
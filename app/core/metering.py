@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.core.metrics import metrics
+from app.crud.usage import USAGE_COUNTERS, token_usage_crud
+from app.models.db import AutocommitSessionLocal
+from app.schemas.chat import Usage
+
+logger = logging.getLogger(__name__)
+
+UsageKey = Tuple[str, str, date]
+
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+class UsageMeter:
+    """
+    token 用量计量。
+    每次请求的用量按用户、模型、日期在内存中累加，定期或累积到 max_pending 条后
+    用一条 upsert 批量写入 token_usage 表，不逐请求写库。
+    配额检查读取聚合计数：已落库的当日用量（短期缓存）加上本进程尚未落库的增量。
+    """
+
+    def __init__(self, flush_interval: float, max_pending: int, cache_ttl: float):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.cache_ttl = cache_ttl
+        self._pending: Dict[UsageKey, List[int]] = {}
+        # 正在写入的批次，写入完成前仍计入配额
+        self._inflight: Dict[UsageKey, List[int]] = {}
+        self._stored: Dict[Tuple[str, date], Tuple[int, float]] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+        metrics.gauge("usage_meter_pending", lambda: len(self._pending))
+
+    def record(self, user_id: str, model: Optional[str], usage: Usage):
+        key = (str(user_id), model or "", today())
+        counters = self._pending.get(key)
+        if counters is None:
+            counters = self._pending[key] = [0] * len(USAGE_COUNTERS)
+        for i, value in enumerate(
+            (
+                1,
+                usage.prompt_tokens or 0,
+                usage.completion_tokens or 0,
+                usage.total_tokens or 0,
+            )
+        ):
+            counters[i] += value
+
+        if len(self._pending) >= self.max_pending and (
+            self._flushing is None or self._flushing.done()
+        ):
+            self._flushing = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+            rows = [
+                {
+                    "user_id": user_id,
+                    "model": model,
+                    "day": day,
+                    **dict(zip(USAGE_COUNTERS, counters)),
+                }
+                for (user_id, model, day), counters in batch.items()
+            ]
+            start = time.perf_counter()
+            try:
+                async with AutocommitSessionLocal() as db:
+                    await token_usage_crud.add_usage(db, rows)
+            except Exception as e:
+                self._inflight = {}
+                logger.error(f"usage flush of {len(rows)} rows failed: {e}")
+                metrics.incr("usage_flush_errors")
+                # 放回待写入，下次重试
+                for key, counters in batch.items():
+                    pending = self._pending.setdefault(key, [0] * len(counters))
+                    for i, value in enumerate(counters):
+                        pending[i] += value
+                return
+
+            self._inflight = {}
+            metrics.incr("usage_flushes")
+            metrics.incr("usage_flushed_rows", len(rows))
+            metrics.observe("usage_flush_seconds", time.perf_counter() - start)
+            # 已缓存的落库用量同步加上本批增量，避免在缓存过期前少算
+            total = USAGE_COUNTERS.index("total_tokens")
+            for (user_id, _, day), counters in batch.items():
+                stored = self._stored.get((user_id, day))
+                if stored is not None:
+                    self._stored[(user_id, day)] = (
+                        stored[0] + counters[total],
+                        stored[1],
+                    )
+
+    async def used_today(self, user_id: str) -> int:
+        """用户当日已用 token 数"""
+        user_id = str(user_id)
+        day = today()
+        now = time.monotonic()
+        stored = self._stored.get((user_id, day))
+        if stored is None or stored[1] <= now:
+            async with AutocommitSessionLocal() as db:
+                value = await token_usage_crud.total_tokens_for_day(db, user_id, day)
+            stored = self._stored[(user_id, day)] = (value, now + self.cache_ttl)
+
+        total = USAGE_COUNTERS.index("total_tokens")
+        pending = sum(
+            counters[total]
+            for batch in (self._pending, self._inflight)
+            for (uid, _, d), counters in batch.items()
+            if uid == user_id and d == day
+        )
+        return stored[0] + pending
+
+    async def check_quota(self, user_id: str) -> bool:
+        """未超过每日配额时返回 True"""
+        quota = settings.TOKEN_QUOTA_DAILY
+        if not quota:
+            return True
+        return await self.used_today(user_id) < quota
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            # 丢弃过期的落库用量缓存
+            now = time.monotonic()
+            for key in [k for k, v in self._stored.items() if v[1] <= now]:
+                del self._stored[key]
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+usage_meter = UsageMeter(
+    flush_interval=settings.USAGE_FLUSH_INTERVAL,
+    max_pending=settings.USAGE_FLUSH_MAX_PENDING,
+    cache_ttl=settings.USAGE_QUOTA_CACHE_TTL,
+)
@@ -0,0 +1,47 @@
+from collections import defaultdict
+from typing import Any, Callable, Dict
+
+
+def _key(name: str, labels: Dict[str, Any]) -> str:
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+class Metrics:
+    """
+    进程内指标注册表。
+    counter 累加计数，observe 记录分布的 count / sum / max，
+    gauge 注册回调，在导出快照时实时计算。
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._summaries: Dict[str, Dict[str, float]] = {}
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+
+    def incr(self, name: str, value: float = 1, **labels):
+        self._counters[_key(name, labels)] += value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        summary = self._summaries.get(key)
+        if summary is None:
+            summary = self._summaries[key] = {"count": 0, "sum": 0.0, "max": 0.0}
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["max"] = max(summary["max"], value)
+
+    def gauge(self, name: str, fn: Callable[[], Any]):
+        self._gauges[name] = fn
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "counters": dict(self._counters),
+            "summaries": {k: dict(v) for k, v in self._summaries.items()},
+            "gauges": {name: fn() for name, fn in self._gauges.items()},
+        }
+
+
+metrics = Metrics()
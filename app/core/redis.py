@@ -0,0 +1,11 @@
+import redis.asyncio as redis
+
+from app.config import settings
+
+# 应用共享的异步 Redis 客户端，首次执行命令时才建立连接
+redis_client = redis.Redis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    db=settings.REDIS_DB,
+    password=settings.REDIS_PASSWORD,
+)
@@ -0,0 +1,176 @@
+import asyncio
+import time
+from typing import AsyncIterable, AsyncIterator, Mapping, Optional, Union
+
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.config import settings
+from app.core.metrics import metrics
+
+# 关闭代理 / 浏览器缓冲，保证 SSE 帧及时到达客户端
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+HEARTBEAT_FRAME = b": ping\n\n"
+
+_END = object()
+
+
+async def coalesce_sse(
+    source: AsyncIterable[Union[bytes, str]],
+    window: float,
+    max_bytes: int,
+    heartbeat_interval: float,
+    queue_size: int = 0,
+) -> AsyncIterator[bytes]:
+    """
+    合并 SSE 帧。
+    距离上次写出已超过 window 秒的帧立即写出（首 token 不受影响），
+    window 内连续到达的帧合并为一次写出，累计超过 max_bytes 时提前写出；
+    空闲超过 heartbeat_interval 秒时发送注释心跳。
+    window 或 heartbeat_interval 为 0 时关闭对应功能。
+    上游与写出之间最多缓冲 queue_size 帧（0 表示不限制），缓冲满时暂停读取上游。
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def pump():
+        try:
+            async for item in source:
+                await queue.put(item.encode() if isinstance(item, str) else item)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(_END)
+
+    task = asyncio.create_task(pump())
+    buffer: list[bytes] = []
+    size = 0
+    last_flush = float("-inf")
+    deadline: Optional[float] = None
+    try:
+        while True:
+            if deadline is not None:
+                timeout = max(deadline - time.monotonic(), 0)
+            else:
+                timeout = heartbeat_interval or None
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except TimeoutError:
+                if buffer:
+                    yield b"".join(buffer)
+                    buffer.clear()
+                    size = 0
+                    last_flush = time.monotonic()
+                    deadline = None
+                else:
+                    yield HEARTBEAT_FRAME
+                continue
+
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            now = time.monotonic()
+            if not buffer and now - last_flush >= window:
+                yield item
+                last_flush = now
+                continue
+
+            buffer.append(item)
+            size += len(item)
+            if size >= max_bytes:
+                yield b"".join(buffer)
+                buffer.clear()
+                size = 0
+                last_flush = now
+                deadline = None
+            elif deadline is None:
+                deadline = last_flush + window
+
+        if buffer:
+            yield b"".join(buffer)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+class SSEStreamingResponse(StreamingResponse):
+    """
+    SSE 流式响应。
+    在 StreamingResponse 外层做帧合并与空闲心跳，并设置关闭代理缓冲的响应头；
+    显式监听客户端断开，断开后立即停止写出并关闭 content，不必等到下一次写失败。
+    """
+
+    media_type = "text/event-stream"
+
+    def __init__(
+        self,
+        content: AsyncIterable[Union[bytes, str]],
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        *,
+        coalesce_window_ms: Optional[int] = None,
+        coalesce_max_bytes: Optional[int] = None,
+        heartbeat_interval: Optional[float] = None,
+    ):
+        window_ms = (
+            settings.SSE_COALESCE_WINDOW_MS
+            if coalesce_window_ms is None
+            else coalesce_window_ms
+        )
+        body = coalesce_sse(
+            content,
+            window=window_ms / 1000,
+            max_bytes=(
+                settings.SSE_COALESCE_MAX_BYTES
+                if coalesce_max_bytes is None
+                else coalesce_max_bytes
+            ),
+            heartbeat_interval=(
+                settings.SSE_HEARTBEAT_INTERVAL
+                if heartbeat_interval is None
+                else heartbeat_interval
+            ),
+            queue_size=settings.SSE_COALESCE_QUEUE_SIZE,
+        )
+        super().__init__(
+            body,
+            status_code=status_code,
+            headers={**SSE_HEADERS, **(headers or {})},
+        )
+        self.disconnected = False
+
+    async def _wait_disconnect(self, receive: Receive):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await super().__call__(scope, receive, send)
+
+        streaming = asyncio.create_task(self.stream_response(send))
+        watcher = asyncio.create_task(self._wait_disconnect(receive))
+        try:
+            await asyncio.wait(
+                {streaming, watcher}, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            streaming.cancel()
+            watcher.cancel()
+            await asyncio.gather(streaming, watcher, return_exceptions=True)
+
+        if streaming.cancelled() or isinstance(streaming.exception(), OSError):
+            # 客户端已断开，取消写出会沿生成器链传递到上游流
+            self.disconnected = True
+            metrics.incr("sse_client_disconnects")
+        elif streaming.exception() is not None:
+            raise streaming.exception()
+
+        if self.background is not None:
+            await self.background()
@@ -155,13 +155,18 @@ class CRUDBase(Generic[ModelType]):
         return result.scalar()
 
     async def insert(
-        self, db: AsyncSession, *, obj_in: Union[Dict[str, Any], BaseModel]
+        self,
+        db: AsyncSession,
+        *,
+        obj_in: Union[Dict[str, Any], BaseModel],
+        refresh: bool = True,
     ) -> ModelType:
         data = obj_in.model_dump() if isinstance(obj_in, BaseModel) else obj_in
         db_obj = self.model(**data)
         db.add(db_obj)
         await db.commit()
-        await db.refresh(db_obj)
+        if refresh:
+            await db.refresh(db_obj)
         return db_obj
 
     async def insert_many(
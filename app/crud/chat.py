@@ -1,11 +1,70 @@
+import uuid
 from uuid import UUID
-from typing import Any, Optional, List
+from datetime import datetime
+from typing import Any, Optional, List, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import (
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    desc,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import REGCONFIG, insert as pg_insert
+from app.config import settings
+from app.core.llm.tokens import content_text
 from app.crud.base import CRUDBase
-from app.models.chat import Conversation, Message
+from app.models.chat import Conversation, Message, RoleType
 from app.schemas.chat import ConversationCreate, MessageCreate, MessageUpdate
-from sqlalchemy.orm import selectinload
+
+# 会话列表中最后一条消息预览的字符数
+PREVIEW_LENGTH = 120
+
+# 检索摘要的高亮标记，使用私有区字符，由接口层转义原文后替换为 <mark>
+HIGHLIGHT_START = "\ue000"
+HIGHLIGHT_STOP = "\ue001"
+HEADLINE_OPTIONS = (
+    f'StartSel="{HIGHLIGHT_START}", StopSel="{HIGHLIGHT_STOP}", '
+    "MaxWords=35, MinWords=15, MaxFragments=2"
+)
+
+# 归档保存的消息列，检索向量由数据库在回迁时重新生成
+ARCHIVE_COLUMNS = [c for c in Message.__table__.c if c.name != "search_vector"]
+
+
+def message_preview(content: Any) -> Optional[str]:
+    """消息内容的单行文本预览，多模态内容只取 text 部分"""
+    return " ".join(content_text(content).split())[:PREVIEW_LENGTH] or None
+
+
+def touch_conversation(conversation_id, preview: Optional[str]):
+    """写入一条消息后更新会话冗余字段的 UPDATE 语句"""
+    return (
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(
+            message_count=Conversation.message_count + 1,
+            last_message_at=func.now(),
+            last_message_preview=preview,
+        )
+    )
+
+
+def _unsummarized(conversation: Conversation) -> list:
+    """尚未纳入摘要的消息的过滤条件，按 (created_at, id) 比较，与摘要边界同一时刻的消息不会被跳过"""
+    if conversation.summarized_until is None:
+        return []
+    if conversation.summarized_until_id is None:
+        # 只记录了时间的旧摘要进度
+        return [Message.created_at > conversation.summarized_until]
+    return [
+        tuple_(Message.created_at, Message.id)
+        > (conversation.summarized_until, conversation.summarized_until_id)
+    ]
 
 
 class CRUDConversation(CRUDBase[Conversation]):
@@ -20,9 +79,120 @@ class CRUDConversation(CRUDBase[Conversation]):
         page: int = 1,
         **kwargs,
     ) -> List[Conversation]:
-        """列出用户的会话"""
+        """列出用户的会话，按最近活跃排序，走 (created_by, last_message_at) 索引"""
+
+        return await self.query(
+            db,
+            page=page,
+            limit=limit,
+            filters=kwargs,
+            order_by=["-last_message_at"],
+        )
+
+    async def update_summary(
+        self,
+        db: AsyncSession,
+        conversation: Conversation,
+        *,
+        summary: str,
+        token_count: int,
+        summarized_until: Message,
+    ) -> bool:
+        """
+        更新会话摘要，summarized_until 为已纳入摘要的最后一条消息。
+        仅当摘要进度与读取时一致才写入，避免并发压缩互相覆盖；写入成功返回 True。
+        """
+        stmt = (
+            update(Conversation)
+            .where(
+                Conversation.id == conversation.id,
+                Conversation.summarized_until.is_not_distinct_from(
+                    conversation.summarized_until
+                ),
+                Conversation.summarized_until_id.is_not_distinct_from(
+                    conversation.summarized_until_id
+                ),
+            )
+            .values(
+                summary=summary,
+                summary_token_count=token_count,
+                summarized_until=summarized_until.created_at,
+                summarized_until_id=summarized_until.id,
+            )
+        )
+        result = await db.execute(stmt)
+        await db.commit()
+        if result.rowcount != 1:
+            return False
+        conversation.summary = summary
+        conversation.summary_token_count = token_count
+        conversation.summarized_until = summarized_until.created_at
+        conversation.summarized_until_id = summarized_until.id
+        return True
+
+    async def list_cold_conversation_ids(
+        self, db: AsyncSession, inactive_before: datetime, limit: int
+    ) -> List[str]:
+        """最后活跃早于 inactive_before、尚未归档且有消息的会话，最久未活跃的在前"""
+        stmt = (
+            select(Conversation.id)
+            .where(
+                Conversation.archive_key.is_(None),
+                Conversation.last_message_at < inactive_before,
+                Conversation.message_count > 0,
+            )
+            .order_by(Conversation.last_message_at)
+            .limit(limit)
+        )
+        result = await db.execute(stmt)
+        return list(result.scalars().all())
+
+    async def get_for_archive(
+        self, db: AsyncSession, id: str, inactive_before: datetime
+    ) -> Optional[Conversation]:
+        """
+        锁定未归档且仍不活跃的会话行直到事务结束。写入消息的外键检查需要该行的共享锁，
+        因此归档期间该会话不会写入新消息；列出冷会话后又有新消息的会话不会被归档。
+        """
+        stmt = (
+            select(Conversation)
+            .where(
+                Conversation.id == id,
+                Conversation.archive_key.is_(None),
+                Conversation.last_message_at < inactive_before,
+            )
+            .with_for_update()
+        )
+        result = await db.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def list_archived(
+        self,
+        db: AsyncSession,
+        created_by: str,
+        conversation_id: Optional[str] = None,
+    ) -> List[Conversation]:
+        """用户已归档的会话"""
+        stmt = select(Conversation).where(
+            Conversation.created_by == created_by,
+            Conversation.archive_key.is_not(None),
+        )
+        if conversation_id is not None:
+            stmt = stmt.where(Conversation.id == conversation_id)
+        result = await db.execute(stmt.order_by(Conversation.id))
+        return list(result.scalars().all())
 
-        return await self.query(db, page=page, limit=limit, filters=kwargs)
+    async def mark_rehydrated(
+        self, db: AsyncSession, id: str, archive_key: str
+    ) -> bool:
+        """清除归档标记，不提交；归档已被其他请求回迁时返回 False"""
+        stmt = (
+            update(Conversation)
+            .where(Conversation.id == id, Conversation.archive_key == archive_key)
+            .values(archived_at=None, archive_key=None)
+        )
+        result = await db.execute(stmt)
+        return result.rowcount == 1
 
     async def create_conversation(
         self, db: AsyncSession, obj_in: ConversationCreate, created_by: UUID
@@ -41,22 +211,303 @@ class CRUDMessage(CRUDBase[Message]):
     async def list_messages(
         self,
         db: AsyncSession,
-        conversation_id: UUID,
-        page: int = 1,
-        limit: int = 100,
-        **kwargs,
-    ) -> List[Conversation]:
-        """列出会话的消息"""
+        conversation_id: str,
+        created_by: str,
+        limit: int = 50,
+        before: Optional[Tuple[datetime, str]] = None,
+    ) -> Optional[Tuple[Conversation, List[dict], bool]]:
+        """
+        游标分页列出会话消息：返回早于 before（created_at, id）的最近 limit 条消息，
+        按时间顺序排列，以及是否还有更早的消息。排序与分页在数据库中完成，
+        走 (conversation_id, created_at, id) 索引，只读取展示所需的列。
+        会话不存在或不属于 created_by 时返回 None。
+        """
+        conversation = await db.get(Conversation, conversation_id)
+        if conversation is None or conversation.created_by != str(created_by):
+            return None
 
         stmt = (
-            select(Conversation)
-            .where(Conversation.id == conversation_id)
-            .options(selectinload(Conversation.messages))
+            select(
+                Message.id,
+                Message.role,
+                Message.content,
+                Message.model,
+                Message.token_count,
+                Message.created_at,
+            )
+            .where(Message.conversation_id == conversation_id)
+            .order_by(desc(Message.created_at), desc(Message.id))
+            .limit(limit + 1)
         )
+        if before is not None:
+            stmt = stmt.where(tuple_(Message.created_at, Message.id) < before)
+        rows = (await db.execute(stmt)).mappings().all()
+        has_more = len(rows) > limit
+        return conversation, list(reversed(rows[:limit])), has_more
 
+    async def insert_user_turn(
+        self,
+        db: AsyncSession,
+        *,
+        conversation_id: Optional[str],
+        created_by: str,
+        content: Any,
+        title: Optional[str] = None,
+        token_count: Optional[int] = None,
+    ) -> Optional[str]:
+        """
+        用一条语句写入一轮对话的用户消息并更新会话的冗余字段，返回会话ID。
+        conversation_id 为空时在同一语句中创建会话；
+        否则仅当会话属于 created_by 时写入，会话不存在时返回 None。
+        """
+        columns = Message.__table__.c
+        preview = message_preview(content)
+        if conversation_id is None:
+            # 同一语句中的 UPDATE 看不到 CTE 新插入的行，新会话直接写入冗余字段
+            conversation = (
+                insert(Conversation)
+                .values(
+                    id=str(uuid.uuid4()),
+                    title=title,
+                    created_by=created_by,
+                    message_count=1,
+                    last_message_preview=preview,
+                )
+                .returning(Conversation.id)
+                .cte("new_conversation")
+            )
+            source = select(conversation.c.id)
+        else:
+            source = select(Conversation.id).where(
+                Conversation.id == conversation_id,
+                Conversation.created_by == created_by,
+            )
+
+        stmt = (
+            insert(Message)
+            .from_select(
+                [
+                    "conversation_id",
+                    "id",
+                    "role",
+                    "content",
+                    "created_by",
+                    "token_count",
+                ],
+                source.add_columns(
+                    literal(str(uuid.uuid4()), columns.id.type),
+                    literal(RoleType.USER, columns.role.type),
+                    literal(content, columns.content.type),
+                    literal(created_by, columns.created_by.type),
+                    literal(token_count, columns.token_count.type),
+                ),
+            )
+            .returning(Message.conversation_id)
+        )
+        if conversation_id is not None:
+            message = stmt.cte("new_message")
+            stmt = (
+                touch_conversation(message.c.conversation_id, preview)
+                .add_cte(message)
+                .returning(Conversation.id)
+            )
+        result = await db.execute(stmt)
+        await db.commit()
+        return result.scalar_one_or_none()
+
+    async def append_message(self, db: AsyncSession, *, obj_in: dict) -> None:
+        """写入一条消息，并在同一语句中更新会话的消息数、最后消息时间与预览"""
+        message = (
+            insert(Message)
+            .values(id=str(uuid.uuid4()), **obj_in)
+            .returning(Message.conversation_id)
+            .cte("new_message")
+        )
+        stmt = touch_conversation(
+            message.c.conversation_id, message_preview(obj_in["content"])
+        ).add_cte(message)
+        await db.execute(stmt)
+        await db.commit()
+
+    async def list_context_messages(
+        self,
+        db: AsyncSession,
+        conversation_id: str,
+        created_by: str,
+        limit: int,
+    ) -> Optional[Tuple[Conversation, List[Message]]]:
+        """
+        返回会话及其尚未纳入摘要的最近 limit 条消息（按时间顺序），用于组装上下文；
+        会话不存在或不属于 created_by 时返回 None。
+        """
+        conversation = await db.get(Conversation, conversation_id)
+        if conversation is None or conversation.created_by != created_by:
+            return None
+        stmt = (
+            select(Message)
+            .where(
+                Message.conversation_id == conversation_id,
+                *_unsummarized(conversation),
+            )
+            .order_by(desc(Message.created_at), desc(Message.id))
+            .limit(limit)
+        )
+        result = await db.execute(stmt)
+        return conversation, list(reversed(result.scalars().all()))
+
+    async def list_unsummarized_messages(
+        self, db: AsyncSession, conversation: Conversation
+    ) -> List[Message]:
+        """按时间顺序返回尚未纳入摘要的全部消息"""
+        stmt = (
+            select(Message)
+            .where(
+                Message.conversation_id == conversation.id,
+                *_unsummarized(conversation),
+            )
+            .order_by(Message.created_at, Message.id)
+        )
+        result = await db.execute(stmt)
+        return list(result.scalars().all())
+
+    async def search_messages(
+        self,
+        db: AsyncSession,
+        created_by: str,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> List[dict]:
+        """
+        在用户的消息中全文检索，按相关度排序。
+        匹配与排序走 (created_by, search_vector) GIN 索引，
+        高亮摘要只为当前页的结果生成。
+        """
+        config = cast(settings.CHAT_SEARCH_TEXT_CONFIG, REGCONFIG)
+        tsquery = func.websearch_to_tsquery(config, query)
+        rank = func.ts_rank_cd(Message.search_vector, tsquery)
+        matches = (
+            select(
+                Message.id,
+                Message.conversation_id,
+                Message.role,
+                Message.content,
+                Message.created_at,
+                rank.label("rank"),
+            )
+            .where(
+                Message.created_by == created_by,
+                Message.search_vector.bool_op("@@")(tsquery),
+            )
+            .order_by(desc("rank"), desc(Message.created_at))
+            .limit(limit)
+            .offset(offset)
+            .subquery()
+        )
+        stmt = (
+            select(
+                matches.c.id.label("message_id"),
+                matches.c.conversation_id,
+                Conversation.title.label("conversation_title"),
+                matches.c.role,
+                matches.c.created_at,
+                matches.c.rank,
+                func.ts_headline(
+                    config,
+                    func.message_content_text(matches.c.content),
+                    tsquery,
+                    HEADLINE_OPTIONS,
+                ).label("snippet"),
+            )
+            .join(Conversation, Conversation.id == matches.c.conversation_id)
+            .order_by(desc(matches.c.rank), desc(matches.c.created_at))
+        )
+        result = await db.execute(stmt)
+        return list(result.mappings().all())
+
+    def export_statement(
+        self,
+        created_by: str,
+        conversation_id: Optional[str] = None,
+        archived: bool = False,
+    ):
+        """
+        导出查询：用户的消息按会话、时间顺序排列，附带会话信息。
+        会话左连接消息，没有消息的会话返回一行消息字段为空的记录，保证每个会话都被导出。
+        archived 为 True 时只查询已归档会话在归档后写入的消息。
+        """
+        stmt = (
+            select(
+                Conversation.id.label("conversation_id"),
+                Conversation.title.label("conversation_title"),
+                Conversation.created_at.label("conversation_created_at"),
+                Message.id,
+                Message.role,
+                Message.content,
+                Message.model,
+                Message.prompt_tokens,
+                Message.completion_tokens,
+                Message.total_tokens,
+                Message.finish_reason,
+                Message.created_at,
+            )
+            .select_from(Conversation)
+            .outerjoin(Message, Message.conversation_id == Conversation.id)
+            .where(
+                Conversation.created_by == created_by,
+                (
+                    Conversation.archive_key.is_not(None)
+                    if archived
+                    else Conversation.archive_key.is_(None)
+                ),
+            )
+            .order_by(Conversation.id, Message.created_at, Message.id)
+        )
+        if conversation_id is not None:
+            stmt = stmt.where(Conversation.id == conversation_id)
+        return stmt
+
+    async def list_archive_rows(
+        self, db: AsyncSession, conversation_id: str
+    ) -> List[dict]:
+        stmt = (
+            select(*ARCHIVE_COLUMNS)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at, Message.id)
+        )
+        result = await db.execute(stmt)
+        return [dict(row) for row in result.mappings().all()]
+
+    async def delete_archived(
+        self, db: AsyncSession, conversation_id: str, ids: List[str]
+    ) -> int:
+        """删除已写入归档的消息，只删除给定的ID，不提交"""
+        stmt = delete(Message).where(
+            Message.conversation_id == conversation_id, Message.id.in_(ids)
+        )
         result = await db.execute(stmt)
-        conversation = result.scalar_one_or_none()
-        return conversation
+        return result.rowcount
+
+    async def restore(self, db: AsyncSession, rows: List[dict]) -> None:
+        """回迁归档的消息，已存在的消息跳过，不提交"""
+        if not rows:
+            return
+        stmt = (
+            pg_insert(Message)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=[Message.id])
+        )
+        await db.execute(stmt)
+
+    async def update_token_counts(self, db: AsyncSession, counts: dict) -> None:
+        """批量回填消息的 token 数"""
+        if not counts:
+            return
+        await db.execute(
+            update(Message),
+            [{"id": id, "token_count": count} for id, count in counts.items()],
+        )
+        await db.commit()
 
     async def create_message(
         self, db: AsyncSession, obj_in: MessageCreate, created_by: UUID
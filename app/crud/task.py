@@ -1,7 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import inspect, select, update
 from app.crud.base import CRUDBase
-from app.models.task import Task
+from app.models.task import Task, TaskStatus
 from app.models.user import User, OAuthAccount
 from app.schemas.user import UserCreate, UserUpdate
 from app.core.security import get_password_hash
@@ -10,7 +10,25 @@ from typing import Optional
 
 
 class CRUDTask(CRUDBase[Task]):
-    pass
+    async def update_unless_cancelled(
+        self, db: AsyncSession, *, db_obj: Task, obj_in: dict
+    ) -> bool:
+        """
+        任务未被取消时更新，返回是否已更新。
+        取消由接口直接写库，不能依据对象上已加载的状态判断，条件写在 UPDATE 语句中。
+        """
+        # 回滚后对象属性已过期，主键从 identity 取，避免触发懒加载
+        task_id = inspect(db_obj).identity[0]
+        stmt = (
+            update(Task)
+            .where(Task.id == task_id, Task.status != TaskStatus.CANCELLED)
+            .values(**obj_in)
+            .execution_options(synchronize_session=False)
+        )
+        result = await db.execute(stmt)
+        await db.commit()
+        await db.refresh(db_obj)
+        return result.rowcount == 1
 
 
 task_crud: CRUDTask = CRUDTask(Task)
@@ -0,0 +1,45 @@
+import uuid
+from datetime import date
+from typing import Any, Dict, List
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.crud.base import CRUDBase
+from app.models.usage import TokenUsage
+
+USAGE_COUNTERS = ("requests", "prompt_tokens", "completion_tokens", "total_tokens")
+
+
+class CRUDTokenUsage(CRUDBase[TokenUsage]):
+    async def add_usage(self, db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+        """批量累加用量，一条 INSERT ... ON CONFLICT DO UPDATE 语句写入"""
+        if not rows:
+            return
+        stmt = insert(TokenUsage).values(
+            [{"id": str(uuid.uuid4()), **row} for row in rows]
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_token_usage_user_model_day",
+            set_={
+                **{
+                    name: getattr(TokenUsage, name) + getattr(stmt.excluded, name)
+                    for name in USAGE_COUNTERS
+                },
+                "updated_at": func.current_timestamp(),
+            },
+        )
+        await db.execute(stmt)
+        await db.commit()
+
+    async def total_tokens_for_day(
+        self, db: AsyncSession, user_id: str, day: date
+    ) -> int:
+        """用户当日所有模型的 token 总量"""
+        stmt = select(func.coalesce(func.sum(TokenUsage.total_tokens), 0)).where(
+            TokenUsage.user_id == user_id, TokenUsage.day == day
+        )
+        result = await db.execute(stmt)
+        return result.scalar()
+
+
+token_usage_crud = CRUDTokenUsage(TokenUsage)
@@ -36,6 +36,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         content=ApiResponse(
             code=exc.status_code, msg=exc.detail, data=None
         ).model_dump(),
+        headers=exc.headers,
     )
 
 
@@ -1,6 +1,9 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
-from app.api import auth, files, task
-from app.api.v1 import chat
+from app.api import auth, files, metrics, task
+from app.api.v1 import batch, chat
+from app.core.llm.transport import close_http_clients
+from app.core.metering import usage_meter
 from app.handlers import exception_handler
 
 
@@ -9,9 +12,19 @@ def config_router(app: FastAPI, prefix: str = "/api"):
     app.include_router(files.router, prefix=prefix)
     app.include_router(task.router, prefix=prefix)
     app.include_router(chat.router, prefix=prefix)
+    app.include_router(batch.router, prefix=prefix)
+    app.include_router(metrics.router, prefix=prefix)
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    usage_meter.start()
+    yield
+    await usage_meter.stop()
+    await close_http_clients()
+
+
+app = FastAPI(lifespan=lifespan)
 config_router(app)
 
 
@@ -2,3 +2,4 @@ from .user import User, OAuthAccount
 from .task import Task
 from .common import UploadFile
 from .chat import Conversation, Message
+from .usage import TokenUsage
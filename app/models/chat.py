@@ -2,10 +2,31 @@ from app.models.db import Base
 from app.models.base import TimestampMixin
 import uuid
 from sqlalchemy.orm import mapped_column, Mapped, relationship
-from sqlalchemy import ForeignKey, String, Text, Enum, JSON, Integer
+from datetime import datetime
+from sqlalchemy import (
+    Computed,
+    DateTime,
+    ForeignKey,
+    Index,
+    String,
+    Text,
+    Enum,
+    JSON,
+    Integer,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from app.config import settings
 from .types import StringUUID
 import enum
 
+# 由 content 的文本部分生成的检索向量，message_content_text 为迁移中创建的 SQL 函数
+SEARCH_VECTOR_EXPRESSION = (
+    f"to_tsvector('{settings.CHAT_SEARCH_TEXT_CONFIG}'::regconfig, "
+    "coalesce(message_content_text(content), ''))"
+)
+
 
 class RoleType(str, enum.Enum):
     USER = "user"
@@ -15,12 +36,50 @@ class RoleType(str, enum.Enum):
 
 class Conversation(TimestampMixin, Base):
     __tablename__ = "conversations"
+    # 会话列表按最近活跃排序
+    __table_args__ = (
+        Index(
+            "ix_conversations_created_by_last_message_at",
+            "created_by",
+            text("last_message_at DESC"),
+        ),
+        # 归档任务按最后活跃时间查找未归档的冷会话
+        Index(
+            "ix_conversations_last_message_at_unarchived",
+            "last_message_at",
+            postgresql_where=text("archive_key IS NULL"),
+        ),
+    )
 
     id: Mapped[str] = mapped_column(
         StringUUID, primary_key=True, default=uuid.uuid4, index=True
     )
     title: Mapped[str | None] = mapped_column(String(255), nullable=True, index=True)
-    created_by: Mapped[str] = mapped_column(StringUUID, nullable=False, index=True)
+    created_by: Mapped[str] = mapped_column(StringUUID, nullable=False)
+
+    # 随消息写入在同一语句中维护的冗余字段，会话列表无需查询消息表
+    message_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default=text("0")
+    )
+    last_message_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    last_message_preview: Mapped[str | None] = mapped_column(String(255), nullable=True)
+
+    # 冷会话归档：消息压缩后存入对象存储，会话行作为占位保留，再次打开时回迁
+    archived_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    archive_key: Mapped[str | None] = mapped_column(String(255), nullable=True)
+
+    # 后台压缩生成的早期对话摘要，(summarized_until, summarized_until_id)
+    # 为已纳入摘要的最后一条消息的 (创建时间, ID)
+    summary: Mapped[str | None] = mapped_column(Text, nullable=True)
+    summary_token_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    summarized_until: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    summarized_until_id: Mapped[str | None] = mapped_column(StringUUID, nullable=True)
 
     messages: Mapped[list["Message"]] = relationship(
         "Message", back_populates="conversation", cascade="all, delete-orphan"
@@ -29,12 +88,28 @@ class Conversation(TimestampMixin, Base):
 
 class Message(TimestampMixin, Base):
     __tablename__ = "messages"
+    # 会话内按时间的游标分页与上下文查询，id 用于同一时间戳内的排序
+    __table_args__ = (
+        Index(
+            "ix_messages_conversation_id_created_at",
+            "conversation_id",
+            "created_at",
+            "id",
+        ),
+        # 按用户范围的全文检索，需要 btree_gin 扩展
+        Index(
+            "ix_messages_created_by_search_vector",
+            "created_by",
+            "search_vector",
+            postgresql_using="gin",
+        ),
+    )
 
     id: Mapped[str] = mapped_column(
         StringUUID, primary_key=True, default=uuid.uuid4, index=True
     )
     conversation_id: Mapped[str] = mapped_column(
-        StringUUID, ForeignKey("conversations.id"), nullable=False, index=True
+        StringUUID, ForeignKey("conversations.id"), nullable=False
     )
     role: Mapped[RoleType] = mapped_column(Enum(RoleType), nullable=False, index=True)
     content: Mapped[dict | list | str] = mapped_column(JSON, nullable=False)
@@ -47,6 +122,12 @@ class Message(TimestampMixin, Base):
     total_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
     finish_reason: Mapped[str | None] = mapped_column(String(50), nullable=True)
+    # 本地 tokenizer 计算的消息 token 数，组装上下文时不必重新计算
+    token_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # 全文检索向量，由数据库在写入时生成，默认不随消息加载
+    search_vector: Mapped[str | None] = mapped_column(
+        TSVECTOR, Computed(SEARCH_VECTOR_EXPRESSION, persisted=True), deferred=True
+    )
 
     conversation: Mapped["Conversation"] = relationship(
         "Conversation", back_populates="messages"
@@ -1,11 +1,36 @@
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import settings
+from app.core.metrics import metrics
 
 DATABASE_URL = f"postgresql+asyncpg://{settings.PGUSER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
-engine = create_async_engine(DATABASE_URL)
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+)
+
+
+def pool_stats() -> dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
+metrics.gauge("db_pool", pool_stats)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    metrics.incr("db_statements")
+
 
 # 创建异步会话工厂
 AsyncSessionLocal = sessionmaker(
@@ -16,6 +41,15 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False,
 )
 
+# 自动提交会话：单条语句的写入本身是原子的，省去 BEGIN / COMMIT 的额外往返
+AutocommitSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=engine.execution_options(isolation_level="AUTOCOMMIT"),
+    class_=AsyncSession,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
 
 
@@ -25,5 +59,3 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             yield session
         finally:
             await session.close()
-
-
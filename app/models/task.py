@@ -1,7 +1,7 @@
 from app.models.db import Base
 from app.models.base import TimestampMixin
 import enum, uuid
-from sqlalchemy import Enum, text, Column, String, Text
+from sqlalchemy import Enum, Integer, text, Column, String, Text
 from sqlalchemy.orm import mapped_column, Mapped
 from .types import StringUUID
 
@@ -28,3 +28,15 @@ class Task(TimestampMixin, Base):
     )
     error: Mapped[str] = mapped_column(Text, nullable=True)
     created_by: Mapped[str] = Column(StringUUID, nullable=False, index=True)
+
+    # 批量推理进度：总条数、已处理条数（含失败）、失败条数，以及结果文件
+    total: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default=text("0")
+    )
+    completed: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default=text("0")
+    )
+    failed: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default=text("0")
+    )
+    output_file_id: Mapped[str | None] = mapped_column(String(255), nullable=True)
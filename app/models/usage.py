@@ -0,0 +1,30 @@
+from app.models.db import Base
+from app.models.base import TimestampMixin
+import uuid
+from datetime import date
+from sqlalchemy import BigInteger, Date, Integer, String, UniqueConstraint
+from sqlalchemy.orm import mapped_column, Mapped
+from .types import StringUUID
+
+
+class TokenUsage(TimestampMixin, Base):
+    """按用户、模型、日期聚合的 token 用量"""
+
+    __tablename__ = "token_usage"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "model", "day", name="uq_token_usage_user_model_day"
+        ),
+    )
+
+    id: Mapped[str] = mapped_column(StringUUID, primary_key=True, default=uuid.uuid4)
+    user_id: Mapped[str] = mapped_column(StringUUID, nullable=False, index=True)
+    model: Mapped[str] = mapped_column(String(100), nullable=False, default="")
+    day: Mapped[date] = mapped_column(Date, nullable=False, index=True)
+
+    requests: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    prompt_tokens: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    completion_tokens: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    total_tokens: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
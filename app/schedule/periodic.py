@@ -1,4 +1,6 @@
 from app.celery_app import celery_app
+from app.config import settings
+from app.tasks.archive import archive_cold_conversations
 from celery.schedules import crontab
 
 
@@ -13,6 +15,13 @@ def setup_periodic_tasks(sender, **kwargs):
     # Executes every 10 seconds
     sender.add_periodic_task(10.0, print_task.s("Hello World"))
 
+    # 每天凌晨归档冷会话
+    if settings.CHAT_ARCHIVE_ENABLED:
+        sender.add_periodic_task(
+            crontab(hour=3, minute=0),
+            archive_cold_conversations.s(),
+        )
+
 
 @celery_app.task
 def print_task(text):
@@ -14,6 +14,8 @@ class ChatCompletionRequest(BaseModel):
     # model: Optional[str] = "THUDM/GLM-4.1V-9B-Thinking"
     model: Optional[str] = "Kwai-Kolors/Kolors"
     messages: List[ChatMessage]
+    # client: messages 为完整历史；server: messages 只包含新消息，历史由服务端按会话重建
+    history: Literal["client", "server"] = "client"
     temperature: Optional[float] = 0.7
     top_p: Optional[float] = 1.0
     n: Optional[int] = 1
@@ -56,6 +58,9 @@ class ConversationList(BaseModel):
 class ConversationOut(BaseModel):
     id: str
     title: Optional[str] = None
+    message_count: int = 0
+    last_message_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -107,9 +112,11 @@ class ChatCompletionStreamResponse(BaseModel):
     """流式聊天补全响应的数据块模型"""
 
     id: str
+    object: str = "chat.completion.chunk"
     created: int
     model: str
     choices: List[ChatCompletionStreamChoice]
+    usage: Optional[Usage] = None
 
 
 class HistoryMessage(BaseModel):
@@ -117,15 +124,50 @@ class HistoryMessage(BaseModel):
     role: str
     content: Any
     model: Optional[str] = None
+    token_count: Optional[int] = None
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class MessageHistoryIn(BaseModel):
+    # 上一页返回的 next_cursor，为空时从最新的消息开始
+    cursor: Optional[str] = None
+    limit: int = Field(50, ge=1, le=200)
+
+
+class MessageSearchIn(BaseModel):
+    q: str = Field(
+        ..., min_length=1, max_length=200, description="检索词，支持引号短语与 - 排除"
+    )
+    limit: int = Field(20, ge=1, le=50)
+    offset: int = Field(0, ge=0, le=1000)
+
+
+class MessageSearchHit(BaseModel):
+    message_id: str
+    conversation_id: str
+    conversation_title: Optional[str] = None
+    role: str
     created_at: datetime
+    rank: float
+    # HTML 转义后的摘要，命中词以 <mark> 标记
+    snippet: str
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class MessageSearchOut(BaseModel):
+    list: List[MessageSearchHit]
+
+
 class ConversationHistoryResponse(BaseModel):
     id: str
     title: Optional[str] = None
     current_model: str
     messages: List[HistoryMessage]
+    # 更早一页的游标，has_more 为 False 时为空
+    next_cursor: Optional[str] = None
+    has_more: bool = False
 
     model_config = ConfigDict(from_attributes=True)
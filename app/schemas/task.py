@@ -25,7 +25,23 @@ class TaskListOut(BaseModel):
     task_id: str = Field(..., description="任务ID")
     file_id: str = Field(..., description="文件ID")
     status: TaskStatus = Field(..., description="任务状态")
+    total: int = Field(0, description="总条数")
+    completed: int = Field(0, description="已处理条数")
+    failed: int = Field(0, description="失败条数")
     created_at: datetime = Field(..., description="创建时间")
     updated_at: datetime = Field(..., description="更新时间")
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class TaskOut(TaskListOut):
+
+    error: Optional[str] = Field(None, description="错误信息")
+    output_file_id: Optional[str] = Field(None, description="结果文件ID")
+
+
+class BatchCreate(BaseModel):
+
+    file_id: str = Field(
+        ..., description="JSONL 文件ID，每行一个 ChatCompletionRequest"
+    )
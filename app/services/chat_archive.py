@@ -0,0 +1,126 @@
+"""
+冷会话归档。
+
+长期未活跃的会话的消息按时间顺序序列化为 gzip 压缩的 NDJSON，存入对象存储后从消息表删除，
+会话行（标题、消息数、最后消息预览等）作为占位保留并记录归档位置。
+会话再次被打开时把消息回迁到消息表并删除归档；归档后写入的新消息留在消息表中，回迁时合并。
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import func
+
+from app.core.metrics import metrics
+from app.core.storage import storage
+from app.crud.chat import conversation_crud, message_crud
+from app.models.chat import Conversation, RoleType
+from app.models.db import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# 回迁时每条 INSERT 语句写入的消息条数
+RESTORE_BATCH_SIZE = 1000
+
+
+def archive_key(conversation: Conversation) -> str:
+    return (
+        f"archives/conversations/{conversation.created_by}/{conversation.id}.ndjson.gz"
+    )
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def dump_messages(rows: List[dict]) -> bytes:
+    body = "".join(
+        json.dumps(row, ensure_ascii=False, default=_default) + "\n" for row in rows
+    )
+    return gzip.compress(body.encode())
+
+
+def load_messages(blob: bytes) -> List[dict]:
+    rows = []
+    for line in gzip.decompress(blob).decode().splitlines():
+        row = json.loads(line)
+        row["role"] = RoleType(row["role"])
+        for field in ("created_at", "updated_at"):
+            if row.get(field):
+                row[field] = datetime.fromisoformat(row[field])
+        rows.append(row)
+    return rows
+
+
+async def archive_conversation(conversation_id: str, inactive_before: datetime) -> int:
+    """
+    归档一个最后活跃早于 inactive_before 的会话，返回归档的消息条数。
+    先写入归档再在同一事务中删除消息并标记会话，事务失败时归档文件只是多余的，不会丢失数据。
+    """
+    async with AsyncSessionLocal() as db:
+        conversation = await conversation_crud.get_for_archive(
+            db, conversation_id, inactive_before
+        )
+        if conversation is None:
+            return 0
+        rows = await message_crud.list_archive_rows(db, conversation_id)
+        if not rows:
+            await db.rollback()
+            return 0
+
+        key = archive_key(conversation)
+        await asyncio.to_thread(storage.save, key, dump_messages(rows))
+        await message_crud.delete_archived(
+            db, conversation_id, [row["id"] for row in rows]
+        )
+        conversation.archived_at = func.now()
+        conversation.archive_key = key
+        await db.commit()
+
+    metrics.incr("chat_archived_conversations")
+    metrics.incr("chat_archived_messages", len(rows))
+    return len(rows)
+
+
+async def archived_messages(conversation: Conversation) -> List[dict]:
+    """读取会话归档中的消息，不回迁"""
+    blob = await asyncio.to_thread(storage.load_once, conversation.archive_key)
+    return load_messages(blob)
+
+
+async def rehydrate(conversation: Conversation) -> bool:
+    """
+    把已归档会话的消息回迁到消息表，回迁成功后删除归档。
+    并发的回迁只有一个会清除归档标记，其余的写入因主键冲突被跳过。
+    """
+    key = conversation.archive_key
+    try:
+        rows = await archived_messages(conversation)
+    except Exception:
+        # 归档可能已被并发的回迁删除
+        async with AsyncSessionLocal() as db:
+            current = await db.get(Conversation, conversation.id)
+            if current is not None and current.archive_key == key:
+                raise
+        return False
+
+    async with AsyncSessionLocal() as db:
+        for i in range(0, len(rows), RESTORE_BATCH_SIZE):
+            await message_crud.restore(db, rows[i : i + RESTORE_BATCH_SIZE])
+        restored = await conversation_crud.mark_rehydrated(db, conversation.id, key)
+        await db.commit()
+
+    if restored:
+        try:
+            await asyncio.to_thread(storage.delete, key)
+        except Exception as e:
+            logger.warning(f"delete archive {key} failed: {e}")
+        metrics.incr("chat_rehydrated_conversations")
+        metrics.incr("chat_rehydrated_messages", len(rows))
+    return restored
@@ -0,0 +1,121 @@
+"""
+会话导出。
+
+通过服务端游标按固定批次读取消息，逐批序列化为 NDJSON（可选 gzip 压缩）直接写入响应，
+内存占用与导出的消息总数无关。每个会话先输出一行 type=conversation 的会话信息，
+随后是该会话按时间顺序的 type=message 行。
+已归档的会话在最后逐个从归档读取，与归档后写入的消息合并输出，导出不会触发回迁。
+"""
+
+import json
+import zlib
+from contextlib import aclosing
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from app.config import settings
+from app.core.metrics import metrics
+from app.crud.chat import conversation_crud, message_crud
+from app.models.db import AsyncSessionLocal
+from app.services.chat_archive import archived_messages
+
+# 导出的消息字段
+MESSAGE_FIELDS = (
+    "conversation_id",
+    "id",
+    "role",
+    "content",
+    "model",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "finish_reason",
+    "created_at",
+)
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _line(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, default=_default) + "\n"
+
+
+def _conversation_line(id: str, title: str, created_at: datetime) -> str:
+    return _line(
+        {"type": "conversation", "id": id, "title": title, "created_at": created_at}
+    )
+
+
+async def export_ndjson(
+    created_by: str, conversation_id: Optional[str] = None
+) -> AsyncIterator[bytes]:
+    """导出用户的全部会话，或其中一个会话，每批消息产出一段 NDJSON"""
+    batch_size = settings.CHAT_EXPORT_BATCH_SIZE
+    stmt = message_crud.export_statement(created_by, conversation_id).execution_options(
+        yield_per=batch_size
+    )
+    current = None
+    exported = 0
+    # 服务端游标需要在事务中读取，导出期间占用一个连接
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt)
+        async for rows in result.mappings().partitions(batch_size):
+            lines: List[str] = []
+            for row in rows:
+                if row["conversation_id"] != current:
+                    current = row["conversation_id"]
+                    lines.append(
+                        _conversation_line(
+                            current,
+                            row["conversation_title"],
+                            row["conversation_created_at"],
+                        )
+                    )
+                if row["id"] is None:
+                    # 没有消息的会话
+                    continue
+                message = dict(row)
+                del message["conversation_title"], message["conversation_created_at"]
+                lines.append(_line({"type": "message", **message}))
+                exported += 1
+            yield "".join(lines).encode()
+
+        archived = await conversation_crud.list_archived(
+            db, created_by, conversation_id
+        )
+        for conversation in archived:
+            messages = await archived_messages(conversation)
+            result = await db.execute(
+                message_crud.export_statement(
+                    created_by, conversation.id, archived=True
+                )
+            )
+            messages.extend(row for row in result.mappings() if row["id"] is not None)
+            messages.sort(key=lambda m: (m["created_at"], m["id"]))
+            lines = [
+                _conversation_line(
+                    conversation.id, conversation.title, conversation.created_at
+                )
+            ]
+            lines.extend(
+                _line({"type": "message", **{f: m[f] for f in MESSAGE_FIELDS}})
+                for m in messages
+            )
+            exported += len(messages)
+            yield "".join(lines).encode()
+    metrics.incr("chat_export_messages", exported)
+
+
+async def gzip_stream(source: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """流式 gzip 压缩"""
+    compressor = zlib.compressobj(wbits=31)
+    async with aclosing(source) as chunks:
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    yield compressor.flush()
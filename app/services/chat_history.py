@@ -0,0 +1,258 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+from app.config import settings
+from app.core.llm.context import count_content
+from app.core.metrics import metrics
+from app.core.redis import redis_client
+from app.crud.chat import message_crud
+from app.models.db import AutocommitSessionLocal
+from app.schemas.chat import ChatMessage
+from app.services.chat_archive import rehydrate
+
+logger = logging.getLogger(__name__)
+
+# 缓存中的一条历史消息：(role, content, token_count)
+Entry = Tuple[str, Any, int]
+
+SUMMARY_PREFIX = "以下是此前对话的摘要：\n"
+
+
+def summary_entry(summary: str, token_count: Optional[int]) -> Entry:
+    """会话摘要以 system 消息的形式放在历史最前面"""
+    content = SUMMARY_PREFIX + summary
+    return ("system", content, token_count or count_content(content, None))
+
+
+def is_summary(entry: Entry) -> bool:
+    return (
+        entry[0] == "system"
+        and isinstance(entry[1], str)
+        and entry[1].startswith(SUMMARY_PREFIX)
+    )
+
+
+class ConversationContextCache:
+    """
+    会话上下文缓存。
+    缓存每个会话最近的消息及其 token 数，写入消息时同步追加，未命中时从数据库加载。
+    memory 后端仅适用于单进程或会话粘滞的部署；多进程部署应使用 redis 后端。
+    键中包含会话所有者，其他用户访问同一会话ID时必然未命中，并由数据库查询校验归属。
+    """
+
+    prefix = "chat:context:"
+
+    def __init__(self, backend: str, max_messages: int, max_conversations: int):
+        self.backend = backend
+        self.max_messages = max_messages
+        self.max_conversations = max_conversations
+        # memory 后端同样按 TTL 过期，后台压缩更新摘要后最迟一个 TTL 生效
+        self._local: OrderedDict[str, Tuple[List[Entry], float]] = OrderedDict()
+        metrics.gauge("chat_context_cache_local", lambda: len(self._local))
+
+    def _key(self, conversation_id: str, created_by: str) -> str:
+        return f"{self.prefix}{created_by}:{conversation_id}"
+
+    async def _get_cached(self, key: str) -> Optional[List[Entry]]:
+        if self.backend == "memory":
+            item = self._local.get(key)
+            if item is None:
+                return None
+            if item[1] <= time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return item[0]
+        try:
+            values = await redis_client.lrange(key, 0, -1)
+        except Exception as e:
+            logger.warning(f"context cache redis get failed: {e}")
+            return None
+        if not values:
+            return None
+        return [tuple(json.loads(v)) for v in values]
+
+    async def _set_cached(self, key: str, entries: List[Entry]):
+        if self.backend == "memory":
+            self._local[key] = (
+                entries,
+                time.monotonic() + settings.CHAT_CONTEXT_CACHE_TTL,
+            )
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_conversations:
+                self._local.popitem(last=False)
+            return
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                if entries:
+                    pipe.rpush(
+                        key, *(json.dumps(e, ensure_ascii=False) for e in entries)
+                    )
+                    pipe.expire(key, settings.CHAT_CONTEXT_CACHE_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"context cache redis set failed: {e}")
+
+    async def _load(
+        self, conversation_id: str, created_by: str, model: Optional[str]
+    ) -> Optional[List[Entry]]:
+        async with AutocommitSessionLocal() as db:
+            loaded = await message_crud.list_context_messages(
+                db, conversation_id, created_by, limit=self.max_messages
+            )
+            if loaded is None:
+                return None
+            conversation, messages = loaded
+            if conversation.archive_key:
+                # 已归档的会话继续对话时先回迁消息
+                await rehydrate(conversation)
+                await db.refresh(conversation)
+                conversation, messages = await message_crud.list_context_messages(
+                    db, conversation_id, created_by, limit=self.max_messages
+                )
+            # 历史数据没有 token 数时计算一次并回填
+            missing = {
+                m.id: count_content(m.content, m.model or model)
+                for m in messages
+                if m.token_count is None
+            }
+            await message_crud.update_token_counts(db, missing)
+
+        entries: List[Entry] = []
+        if conversation.summary:
+            entries.append(
+                summary_entry(conversation.summary, conversation.summary_token_count)
+            )
+        entries.extend(
+            (
+                m.role.value,
+                m.content,
+                m.token_count if m.token_count is not None else missing[m.id],
+            )
+            for m in messages
+        )
+        return entries
+
+    async def get(
+        self, conversation_id: str, created_by: str, model: Optional[str] = None
+    ) -> Optional[List[Entry]]:
+        """会话最近的消息，会话不存在时返回 None"""
+        key = self._key(conversation_id, created_by)
+        entries = await self._get_cached(key)
+        if entries is not None:
+            metrics.incr("chat_context_cache_hits", backend=self.backend)
+            return entries
+
+        metrics.incr("chat_context_cache_misses", backend=self.backend)
+        entries = await self._load(conversation_id, created_by, model)
+        if entries is not None:
+            await self._set_cached(key, entries)
+        return entries
+
+    async def append(
+        self,
+        conversation_id: str,
+        created_by: str,
+        role: str,
+        content,
+        tokens: int,
+        create: bool = False,
+    ):
+        """
+        消息写入数据库后追加到缓存。
+        未缓存的会话不处理，下次访问时从数据库加载；新建的会话传入 create 直接建立缓存。
+        """
+        key = self._key(conversation_id, created_by)
+        entry: Entry = (role, content, tokens)
+        if self.backend == "memory":
+            if create:
+                await self._set_cached(key, [entry])
+                return
+            item = self._local.get(key)
+            if item is not None:
+                item[0].append(entry)
+                del item[0][: -self.max_messages]
+            return
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                value = json.dumps(entry, ensure_ascii=False)
+                if create:
+                    pipe.rpush(key, value)
+                else:
+                    pipe.rpushx(key, value)
+                pipe.ltrim(key, -self.max_messages, -1)
+                pipe.expire(key, settings.CHAT_CONTEXT_CACHE_TTL)
+                await pipe.execute()
+        except Exception as e:
+            # 追加失败时删除缓存，避免读到缺失消息的历史
+            logger.warning(f"context cache redis append failed: {e}")
+            await self.invalidate(conversation_id, created_by)
+
+    async def invalidate(self, conversation_id: str, created_by: str):
+        key = self._key(conversation_id, created_by)
+        if self.backend == "memory":
+            self._local.pop(key, None)
+            return
+        try:
+            await redis_client.delete(key)
+        except Exception as e:
+            logger.warning(f"context cache redis delete failed: {e}")
+
+
+context_cache = ConversationContextCache(
+    backend=settings.CHAT_CONTEXT_CACHE_BACKEND,
+    max_messages=settings.CHAT_CONTEXT_CACHE_MAX_MESSAGES,
+    max_conversations=settings.CHAT_CONTEXT_CACHE_MAX_CONVERSATIONS,
+)
+
+
+class ServerHistory(NamedTuple):
+    messages: List[ChatMessage]
+    # 已知的每条消息 token 数，未知为 None
+    counts: List[Optional[int]]
+    # 未纳入摘要的历史超过阈值，需要后台压缩
+    compact: bool
+
+
+def needs_compaction(entries: List[Entry]) -> bool:
+    if not settings.CHAT_COMPACTION_ENABLED:
+        return False
+    recent = [e for e in entries if not is_summary(e)]
+    return (
+        len(recent) > settings.CHAT_COMPACTION_TRIGGER_MESSAGES
+        or sum(tokens for _, _, tokens in recent)
+        > settings.CHAT_COMPACTION_TRIGGER_TOKENS
+    )
+
+
+async def build_server_history(
+    conversation_id: Optional[str],
+    created_by: str,
+    messages: List[ChatMessage],
+    model: Optional[str],
+) -> Optional[ServerHistory]:
+    """
+    服务端历史模式：请求只携带新消息（以及可选的 system 消息），
+    由缓存的会话历史（摘要 + 最近的消息）重建完整消息列表，并返回已知的每条 token 数。
+    会话不存在时返回 None。
+    """
+    system = [m for m in messages if m.role == "system"]
+    new = [m for m in messages if m.role != "system"]
+    entries: List[Entry] = []
+    if conversation_id:
+        entries = await context_cache.get(conversation_id, created_by, model)
+        if entries is None:
+            return None
+    history = [ChatMessage(role=role, content=content) for role, content, _ in entries]
+    counts: List[Optional[int]] = (
+        [None] * len(system) + [tokens for _, _, tokens in entries] + [None] * len(new)
+    )
+    return ServerHistory(
+        messages=system + history + new,
+        counts=counts,
+        compact=needs_compaction(entries),
+    )
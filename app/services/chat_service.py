@@ -0,0 +1,279 @@
+import asyncio
+from contextlib import aclosing, suppress
+import logging
+import uuid
+from typing import AsyncGenerator, Dict, List, Optional, Set
+
+from app.config import settings
+from app.core.llm import llm_provider
+from app.core.llm.admission import Permit
+from app.core.llm.context import count_content
+from app.core.llm.tokens import complete_usage
+from app.core.metering import usage_meter
+from app.core.metrics import metrics
+from app.crud.chat import message_crud
+from app.models.chat import RoleType
+from app.models.db import AutocommitSessionLocal
+from app.services.chat_history import context_cache
+from app.services.generation_log import frame_with_id, generation_log
+from app.tasks.compaction import schedule_compaction
+from app.schemas.chat import ChatCompletionRequest, Usage
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+# 客户端断开后仍在后台运行的生成任务，持有引用避免被回收
+_detached: Set[asyncio.Task] = set()
+
+# 按模型统计的平均输出 token 数，用于估算取消生成节省的 token
+_mean_completion_tokens: Dict[str, float] = {}
+
+
+class ChatStream:
+    """
+    一次流式对话生成。
+    上游流在独立任务中消费，与客户端连接解耦：客户端断开时按策略立即取消上游生成，
+    或在后台生成完毕并保存助手消息。
+    生成期间不占用数据库连接，仅在保存助手消息时打开短生命周期的会话。
+    可先调用 start 提前发起上游请求，用户消息写入后再调用 set_conversation，
+    助手消息会等到会话ID确定后才保存。
+    启用生成事件日志时，事件按顺序编号并追加到日志，断线的客户端与其他订阅者
+    可以从日志中续读，不会再次请求上游。
+    """
+
+    def __init__(
+        self,
+        request: ChatCompletionRequest,
+        conversation_id: Optional[str],
+        created_by: str,
+        policy: Optional[str] = None,
+        compact: bool = False,
+        permit: Optional[Permit] = None,
+    ):
+        self.request = request
+        self.conversation_id = conversation_id
+        self._conversation_ready = asyncio.Event()
+        if conversation_id is not None:
+            self._conversation_ready.set()
+        self.created_by = created_by
+        self.policy = policy or settings.CHAT_STREAM_DISCONNECT_POLICY
+        # 保存助手消息后为会话排入后台压缩
+        self.compact = compact
+        # 准入许可，生成任务结束（含取消）时释放
+        self.permit = permit
+        self.content_parts: List[str] = []
+        self.finish_reason: Optional[str] = None
+        self.usage: Optional[Usage] = None
+        self.chunks = 0
+        self._metered = False
+        self.detached = False
+        self._detached_at = 0
+        self.generation_id = uuid.uuid4().hex
+        self.log = generation_log
+        self._seq = 0
+        self._queue: asyncio.Queue = asyncio.Queue(
+            maxsize=settings.CHAT_STREAM_QUEUE_SIZE
+        )
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def completion_tokens(self) -> int:
+        if self.usage is not None and self.usage.completion_tokens is not None:
+            return self.usage.completion_tokens
+        return self.chunks
+
+    async def _run(self):
+        cancelled = False
+        try:
+            async with aclosing(
+                llm_provider.stream_generate(self.request, structured=True)
+            ) as stream:
+                async for event in stream:
+                    if event.content:
+                        self.content_parts.append(event.content)
+                        self.chunks += 1
+                    if event.finish_reason:
+                        self.finish_reason = event.finish_reason
+                    if event.usage:
+                        self.usage = event.usage
+                    data = self._publish(event.data)
+                    await self._deliver(data)
+            # 上游未返回用量（或只返回部分字段）时在本地估算
+            self.usage = complete_usage(
+                self.request, "".join(self.content_parts), self.usage
+            )
+            self._meter(self.usage)
+            self._record_completion()
+            await self._save()
+        except asyncio.CancelledError:
+            cancelled = True
+            # 取消前上游已生成的部分同样计入用量
+            self._meter(
+                complete_usage(self.request, "".join(self.content_parts), self.usage)
+            )
+            raise
+        except Exception as e:
+            if self.detached:
+                logger.error(f"detached chat stream failed: {e}")
+            await self._deliver(e)
+        finally:
+            if cancelled:
+                # 被取消时通常已没有读取方，队列已满则不再等待
+                with suppress(asyncio.QueueFull):
+                    self._queue.put_nowait(_END)
+            else:
+                await self._deliver(_END)
+            if self.log is not None:
+                await self.log.close(self.generation_id)
+
+    async def _deliver(self, item):
+        """交给客户端；队列满时等待客户端读取，客户端断开后不再投递"""
+        if not self.detached:
+            await self._queue.put(item)
+
+    def _meter(self, usage: Usage):
+        """计入用量，每次生成只计一次（保存消息时被取消不会重复计入）"""
+        if self._metered:
+            return
+        self._metered = True
+        usage_meter.record(self.created_by, self.request.model, usage)
+
+    def _publish(self, data: bytes) -> bytes:
+        """为事件编号并追加到生成事件日志"""
+        if self.log is None:
+            return data
+        self._seq += 1
+        data = frame_with_id(self._seq, data)
+        self.log.append(self.generation_id, self._seq, data)
+        return data
+
+    def _record_completion(self):
+        model = self.request.model or ""
+        tokens = self.completion_tokens
+        mean = _mean_completion_tokens.get(model)
+        _mean_completion_tokens[model] = (
+            tokens if mean is None else mean + 0.1 * (tokens - mean)
+        )
+        if self.detached:
+            metrics.incr(
+                "chat_stream_unread_tokens",
+                tokens - self._detached_at,
+                model=model,
+            )
+
+    async def set_conversation(self, conversation_id: str):
+        self.conversation_id = conversation_id
+        self._conversation_ready.set()
+        if self.log is not None:
+            await self.log.register(
+                self.generation_id, conversation_id, self.created_by
+            )
+
+    async def _save(self):
+        await self._conversation_ready.wait()
+        usage = self.usage
+        content = "".join(self.content_parts)
+        assistant_message_data = {
+            "conversation_id": self.conversation_id,
+            "role": RoleType.ASSISTANT,
+            "content": content,
+            "model": self.request.model,
+            "prompt_tokens": usage.prompt_tokens if usage else None,
+            "completion_tokens": usage.completion_tokens if usage else None,
+            "total_tokens": usage.total_tokens if usage else None,
+            "finish_reason": self.finish_reason,
+            "token_count": count_content(content, self.request.model),
+            "created_by": self.created_by,
+        }
+        async with AutocommitSessionLocal() as db:
+            await message_crud.append_message(db, obj_in=assistant_message_data)
+        await context_cache.append(
+            self.conversation_id,
+            self.created_by,
+            RoleType.ASSISTANT.value,
+            content,
+            assistant_message_data["token_count"],
+        )
+        if self.compact:
+            await schedule_compaction(self.conversation_id)
+
+    def _abandon(self):
+        """客户端在生成结束前断开"""
+        model = self.request.model or ""
+        metrics.incr("chat_stream_abandoned", policy=self.policy, model=model)
+        self.detached = True
+        self._detached_at = self.completion_tokens
+        # 清空队列，唤醒等待投递的生成任务
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        _detached.add(self._task)
+        self._task.add_done_callback(_detached.discard)
+
+        if self.policy == "background":
+            return
+        if self.log is not None and settings.CHAT_STREAM_RESUME_GRACE > 0:
+            # 可续传时先等待客户端重连，宽限期内无订阅者接入再取消
+            grace = asyncio.create_task(self._cancel_unless_resumed())
+            _detached.add(grace)
+            grace.add_done_callback(_detached.discard)
+            return
+        self._cancel_abandoned()
+
+    async def _cancel_unless_resumed(self):
+        await asyncio.sleep(settings.CHAT_STREAM_RESUME_GRACE)
+        if self._task.done():
+            return
+        if await self.log.subscribers(self.generation_id):
+            metrics.incr("chat_stream_resumed", model=self.request.model or "")
+            return
+        self._cancel_abandoned()
+
+    def _cancel_abandoned(self):
+        model = self.request.model or ""
+        self._task.cancel()
+        # 未生成部分按 max_tokens 或该模型的平均输出长度估算
+        expected = _mean_completion_tokens.get(model)
+        if self.request.max_tokens is not None:
+            expected = min(expected or self.request.max_tokens, self.request.max_tokens)
+        if expected:
+            metrics.incr(
+                "chat_stream_tokens_saved",
+                max(expected - self._detached_at, 0),
+                model=model,
+            )
+
+    def start(self):
+        """发起上游请求，事件先缓存在队列中，直到客户端开始读取；队列满时暂停读取上游"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            if self.permit is not None:
+                self._task.add_done_callback(lambda _: self.permit.release())
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def __aiter__(self) -> AsyncGenerator[bytes, None]:
+        self.start()
+        finished = False
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _END:
+                    finished = True
+                    return
+                if isinstance(item, Exception):
+                    finished = True
+                    raise item
+                yield item
+        finally:
+            if not finished and not self._task.done():
+                self._abandon()
+
+
+def detached_streams() -> int:
+    return len(_detached)
+
+
+metrics.gauge("chat_stream_detached", detached_streams)
@@ -0,0 +1,294 @@
+"""
+生成事件日志。
+
+每次流式生成的 SSE 事件按顺序编号（从 1 开始）追加到只追加的事件日志中，
+客户端断线后可携带 Last-Event-ID 从断点继续读取，多个订阅者可以同时观看同一次生成，
+而不会再次请求上游。
+- memory：进程内环形缓冲区，适用于单进程或会话粘滞的部署
+- redis：Redis Streams，事件ID为 0-<序号>，任意进程都可以订阅
+"""
+
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.core.metrics import metrics
+from app.core.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+
+def frame_with_id(seq: int, data: bytes) -> bytes:
+    """为 SSE 事件加上 id 字段，客户端重连时通过 Last-Event-ID 带回"""
+    return b"id: %d\n" % seq + data
+
+
+class GenerationLog(ABC):
+    @abstractmethod
+    async def register(self, generation_id: str, conversation_id: str, created_by: str):
+        """记录会话当前的生成，供其他订阅者按会话查找"""
+
+    @abstractmethod
+    async def lookup(self, conversation_id: str) -> Optional[Tuple[str, str]]:
+        """会话当前（或最近）的生成，返回 (generation_id, created_by)"""
+
+    @abstractmethod
+    def append(self, generation_id: str, seq: int, data: bytes):
+        """追加一个事件，不阻塞生成"""
+
+    @abstractmethod
+    async def close(self, generation_id: str):
+        """生成结束，订阅者读完已有事件后退出"""
+
+    @abstractmethod
+    def subscribe(self, generation_id: str, after: int = 0) -> AsyncIterator[bytes]:
+        """读取序号大于 after 的事件，直到生成结束"""
+
+    @abstractmethod
+    async def subscribers(self, generation_id: str) -> int:
+        """当前订阅者数量"""
+
+
+class _RingLog:
+    def __init__(self, max_events: int):
+        self.events: Deque[Tuple[int, bytes]] = deque(maxlen=max_events)
+        self.done = False
+        self.subscribers = 0
+        self.conversation_id: Optional[str] = None
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class MemoryGenerationLog(GenerationLog):
+    """进程内环形缓冲区，超出容量的最早事件被丢弃，结束后保留 ttl 秒"""
+
+    def __init__(self, max_events: int, ttl: float):
+        self.max_events = max_events
+        self.ttl = ttl
+        self._logs: Dict[str, _RingLog] = {}
+        self._conversations: Dict[str, Tuple[str, str]] = {}
+        metrics.gauge("chat_generation_logs", lambda: len(self._logs))
+
+    async def register(self, generation_id: str, conversation_id: str, created_by: str):
+        self._log(generation_id).conversation_id = conversation_id
+        self._conversations[conversation_id] = (generation_id, created_by)
+
+    async def lookup(self, conversation_id: str) -> Optional[Tuple[str, str]]:
+        found = self._conversations.get(conversation_id)
+        if found is None or found[0] not in self._logs:
+            return None
+        return found
+
+    def _log(self, generation_id: str) -> _RingLog:
+        log = self._logs.get(generation_id)
+        if log is None:
+            log = self._logs[generation_id] = _RingLog(self.max_events)
+        return log
+
+    def append(self, generation_id: str, seq: int, data: bytes):
+        log = self._log(generation_id)
+        log.events.append((seq, data))
+        log.notify()
+
+    def _expire(self, generation_id: str):
+        log = self._logs.pop(generation_id, None)
+        if log is None or log.conversation_id is None:
+            return
+        found = self._conversations.get(log.conversation_id)
+        if found is not None and found[0] == generation_id:
+            del self._conversations[log.conversation_id]
+
+    async def close(self, generation_id: str):
+        log = self._log(generation_id)
+        log.done = True
+        log.notify()
+        asyncio.get_running_loop().call_later(self.ttl, self._expire, generation_id)
+
+    async def subscribe(
+        self, generation_id: str, after: int = 0
+    ) -> AsyncIterator[bytes]:
+        log = self._logs.get(generation_id)
+        if log is None:
+            return
+        log.subscribers += 1
+        events = log.events
+        try:
+            while True:
+                # 序号连续递增，按与首个事件的序号差直接定位，不重新扫描缓冲区
+                while events and events[-1][0] > after:
+                    seq, data = events[max(after + 1 - events[0][0], 0)]
+                    after = seq
+                    yield data
+                if log.done:
+                    return
+                await log.changed.wait()
+        finally:
+            log.subscribers -= 1
+
+    async def subscribers(self, generation_id: str) -> int:
+        log = self._logs.get(generation_id)
+        return log.subscribers if log else 0
+
+
+class RedisGenerationLog(GenerationLog):
+    """
+    Redis Streams 事件日志。
+    追加在本地排队，由每个生成的写入任务以 pipeline 批量 XADD，不阻塞生成；
+    结束时写入 end 标记并设置过期时间。
+    注册时写入 live 标记，首个事件写入前订阅的客户端据此继续等待；
+    会话到生成的映射在生成期间不过期，结束后保留 ttl 秒；
+    生成在注册前已结束（如缓存回放先于用户消息写入完成）时，注册直接设置过期时间。
+    live 标记带过期时间，进程崩溃未写入 end 标记时订阅者最终也会退出。
+    """
+
+    prefix = "chat:generation:"
+
+    def __init__(self, max_events: int, ttl: int, block_ms: int = 5000):
+        self.max_events = max_events
+        self.ttl = ttl
+        self.block_ms = block_ms
+        self._pending: Dict[str, List[Tuple[int, bytes]]] = {}
+        self._writers: Dict[str, asyncio.Task] = {}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._conversations: Dict[str, str] = {}
+        # 已结束的生成，保留 ttl 秒供随后的注册判断
+        self._finished: Set[str] = set()
+
+    def _key(self, generation_id: str) -> str:
+        return f"{self.prefix}{generation_id}"
+
+    def _conversation_key(self, conversation_id: str) -> str:
+        return f"{self.prefix}conversation:{conversation_id}"
+
+    async def register(self, generation_id: str, conversation_id: str, created_by: str):
+        key = self._conversation_key(conversation_id)
+        value = json.dumps({"id": generation_id, "created_by": created_by})
+        if generation_id in self._finished:
+            await redis_client.set(key, value, ex=self.ttl)
+            return
+        self._conversations[generation_id] = conversation_id
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(key, value)
+        pipe.set(f"{self._key(generation_id)}:live", 1, ex=self.ttl)
+        await pipe.execute()
+        if generation_id in self._finished:
+            # 注册期间生成已结束，结束标记的过期设置可能先于上面的写入到达
+            await redis_client.expire(key, self.ttl)
+
+    async def lookup(self, conversation_id: str) -> Optional[Tuple[str, str]]:
+        value = await redis_client.get(self._conversation_key(conversation_id))
+        if value is None:
+            return None
+        found = json.loads(value)
+        return found["id"], found["created_by"]
+
+    def append(self, generation_id: str, seq: int, data: bytes):
+        self._pending.setdefault(generation_id, []).append((seq, data))
+        wakeup = self._wakeups.get(generation_id)
+        if wakeup is None:
+            wakeup = self._wakeups[generation_id] = asyncio.Event()
+            self._writers[generation_id] = asyncio.create_task(
+                self._write(generation_id, wakeup)
+            )
+        wakeup.set()
+
+    async def _write(self, generation_id: str, wakeup: asyncio.Event):
+        key = self._key(generation_id)
+        done = False
+        while not done:
+            await wakeup.wait()
+            wakeup.clear()
+            batch, self._pending[generation_id] = self._pending[generation_id], []
+            if not batch:
+                continue
+            pipe = redis_client.pipeline(transaction=False)
+            for seq, data in batch:
+                if seq < 0:
+                    pipe.xadd(key, {"end": 1}, id="*")
+                    pipe.expire(key, self.ttl)
+                    pipe.delete(f"{key}:live")
+                    # 写入者可能先于注册启动，结束时再查找会话
+                    conversation_id = self._conversations.get(generation_id)
+                    if conversation_id is not None:
+                        pipe.expire(self._conversation_key(conversation_id), self.ttl)
+                    done = True
+                else:
+                    pipe.xadd(
+                        key,
+                        {"d": data},
+                        id=f"0-{seq}",
+                        maxlen=self.max_events,
+                        approximate=True,
+                    )
+            try:
+                await pipe.execute()
+            except Exception as e:
+                logger.warning(f"generation log write failed: {e}")
+                metrics.incr("chat_generation_log_errors")
+
+    async def close(self, generation_id: str):
+        # 序号 -1 表示结束标记
+        self.append(generation_id, -1, b"")
+        writer = self._writers.pop(generation_id)
+        try:
+            await writer
+        finally:
+            self._wakeups.pop(generation_id, None)
+            self._pending.pop(generation_id, None)
+            self._conversations.pop(generation_id, None)
+            self._finished.add(generation_id)
+            asyncio.get_running_loop().call_later(
+                self.ttl, self._finished.discard, generation_id
+            )
+
+    async def subscribe(
+        self, generation_id: str, after: int = 0
+    ) -> AsyncIterator[bytes]:
+        key = self._key(generation_id)
+        last = f"0-{after}"
+        await redis_client.incr(f"{key}:subscribers")
+        try:
+            while True:
+                result = await redis_client.xread(
+                    {key: last}, count=256, block=self.block_ms
+                )
+                if not result:
+                    # 流尚未创建（首个事件未写入）时以 live 标记判断生成是否仍在进行
+                    if not await redis_client.exists(key, f"{key}:live"):
+                        return
+                    continue
+                for entry_id, fields in result[0][1]:
+                    last = entry_id
+                    if b"end" in fields:
+                        return
+                    yield fields[b"d"]
+        finally:
+            await redis_client.decr(f"{key}:subscribers")
+            await redis_client.expire(f"{key}:subscribers", self.ttl)
+
+    async def subscribers(self, generation_id: str) -> int:
+        value = await redis_client.get(f"{self._key(generation_id)}:subscribers")
+        return int(value or 0)
+
+
+def create_generation_log() -> Optional[GenerationLog]:
+    match settings.CHAT_STREAM_LOG_BACKEND:
+        case "memory":
+            return MemoryGenerationLog(
+                settings.CHAT_STREAM_LOG_MAX_EVENTS, settings.CHAT_STREAM_LOG_TTL
+            )
+        case "redis":
+            return RedisGenerationLog(
+                settings.CHAT_STREAM_LOG_MAX_EVENTS, settings.CHAT_STREAM_LOG_TTL
+            )
+    return None
+
+
+generation_log = create_generation_log()
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from app.celery_app import celery_app
+from app.config import settings
+from app.crud.chat import conversation_crud
+from app.models.db import AsyncSessionLocal
+from app.services.chat_archive import archive_conversation
+from app.tasks.runtime import release_loop_resources
+
+logger = logging.getLogger(__name__)
+
+
+async def archive_cold(limit: int) -> int:
+    """归档最多 limit 个冷会话，返回归档的会话数"""
+    inactive_before = datetime.now(timezone.utc) - timedelta(
+        days=settings.CHAT_ARCHIVE_AFTER_DAYS
+    )
+    async with AsyncSessionLocal() as db:
+        conversation_ids = await conversation_crud.list_cold_conversation_ids(
+            db, inactive_before, limit
+        )
+
+    archived = 0
+    for conversation_id in conversation_ids:
+        try:
+            if await archive_conversation(conversation_id, inactive_before):
+                archived += 1
+        except Exception as e:
+            logger.error(f"archive conversation {conversation_id} failed: {e}")
+    return archived
+
+
+async def _run(limit: int) -> int:
+    try:
+        return await archive_cold(limit)
+    finally:
+        await release_loop_resources()
+
+
+@celery_app.task(name="archive_cold_conversations", queue="low_priority")
+def archive_cold_conversations(limit: int = 0) -> int:
+    archived = asyncio.run(_run(limit or settings.CHAT_ARCHIVE_BATCH_SIZE))
+    logger.info(f"archived {archived} cold conversations")
+    return archived
@@ -0,0 +1,247 @@
+import asyncio
+import datetime
+import json
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app import crud
+from app.celery_app import celery_app
+from app.config import settings
+from app.core.llm import llm_provider
+from app.core.llm.router import is_retryable
+from app.core.llm.tokens import complete_usage, content_text
+from app.core.metering import usage_meter
+from app.core.storage import storage
+from app.models import UploadFile
+from app.models.db import AsyncSessionLocal
+from app.models.task import Task, TaskStatus
+from app.schemas.chat import ChatCompletionRequest
+from app.tasks.runtime import release_loop_resources
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "batches/"
+
+# 重试也不会成功的错误（输入文件缺失、超出行数限制等），直接标记任务失败
+PERMANENT_ERRORS = (ValueError,)
+
+
+def part_key(batch_id: str, index: int) -> str:
+    return f"{PREFIX}{batch_id}/part-{index:06d}.jsonl"
+
+
+def output_key(batch_id: str) -> str:
+    return f"{PREFIX}{batch_id}/output.jsonl"
+
+
+class RateLimiter:
+    """按固定间隔放行请求，rate 为每秒请求数，0 表示不限制"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self._next = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class BatchRunner:
+    """
+    执行一个批量推理任务。
+    输入按 BATCH_CHECKPOINT_SIZE 条分段，段内以有界并发调用上游，每条请求遇到可重试的错误时按指数退避重试；
+    每段的结果写入独立的分段文件后再更新任务进度，任务中断重试时从已完成的段之后继续。
+    全部完成后合并为一个 JSONL 结果文件，并登记到文件表。
+    """
+
+    def __init__(self, task: Task):
+        self.task = task
+        self.batch_id = str(task.id)
+        self.semaphore = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+        self.limiter = RateLimiter(settings.BATCH_MAX_REQUESTS_PER_SECOND)
+
+    async def _generate(self, request: ChatCompletionRequest):
+        error: Optional[Exception] = None
+        for attempt in range(settings.BATCH_MAX_RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(settings.BATCH_RETRY_BACKOFF * 2 ** (attempt - 1))
+            async with self.semaphore:
+                await self.limiter.wait()
+                try:
+                    return await llm_provider.generate(request)
+                except Exception as e:
+                    # 4xx 等请求本身的错误重试无意义
+                    if not is_retryable(getattr(e, "status_code", None)):
+                        raise
+                    error = e
+                    logger.warning(f"batch {self.batch_id} request failed: {e}")
+        raise error
+
+    async def _process(self, index: int, line: bytes) -> Tuple[dict, bool]:
+        """处理一行输入，返回 (结果行, 是否成功)"""
+        result = {"index": index, "custom_id": None, "response": None, "error": None}
+        try:
+            data = json.loads(line)
+            if not isinstance(data, dict):
+                raise ValueError("request line must be a JSON object")
+            result["custom_id"] = data.pop("custom_id", None)
+            request = ChatCompletionRequest.model_validate(data)
+        except (ValueError, ValidationError) as e:
+            result["error"] = {"type": "invalid_request", "message": str(e)}
+            return result, False
+        request.stream = False
+
+        try:
+            response = await self._generate(request)
+        except Exception as e:
+            result["error"] = {"type": "upstream_error", "message": str(e)}
+            return result, False
+
+        usage = complete_usage(
+            request, content_text(response.choices[0].message.content), response.usage
+        )
+        usage_meter.record(self.task.created_by, request.model, usage)
+        result["response"] = response.model_dump(mode="json")
+        return result, True
+
+    async def _run_segment(self, segment: int, lines: List[bytes]) -> int:
+        start = segment * settings.BATCH_CHECKPOINT_SIZE
+        results = await asyncio.gather(
+            *(self._process(start + i, line) for i, line in enumerate(lines))
+        )
+        body = "".join(
+            json.dumps(result, ensure_ascii=False) + "\n" for result, _ in results
+        )
+        await asyncio.to_thread(
+            storage.save, part_key(self.batch_id, segment), body.encode()
+        )
+        return sum(1 for _, ok in results if not ok)
+
+    async def _finish(self, db, segments: int) -> str:
+        """合并分段文件为结果文件，登记到文件表后删除分段"""
+        parts = [part_key(self.batch_id, i) for i in range(segments)]
+        body = b"".join(
+            [await asyncio.to_thread(storage.load_once, key) for key in parts]
+        )
+        key = output_key(self.batch_id)
+        await asyncio.to_thread(storage.save, key, body)
+        output = UploadFile(
+            storage_type=settings.STORAGE_TYPE,
+            key=key,
+            name=f"batch-{self.batch_id}-output.jsonl",
+            size=len(body),
+            extension="jsonl",
+            mime_type="application/jsonl",
+            created_by=self.task.created_by,
+            created_at=datetime.datetime.now(datetime.UTC).replace(tzinfo=None),
+        )
+        db.add(output)
+        await db.flush()
+        for key in parts:
+            await asyncio.to_thread(storage.delete, key)
+        return str(output.id)
+
+    async def run(self, db) -> TaskStatus:
+        file = await crud.file.get(db, primary_key=self.task.file_id)
+        if file is None:
+            raise ValueError(f"input file {self.task.file_id} not found")
+        content = await asyncio.to_thread(storage.load_once, file.key)
+        lines = [line for line in content.splitlines() if line.strip()]
+        if len(lines) > settings.BATCH_MAX_LINES:
+            raise ValueError(f"batch exceeds {settings.BATCH_MAX_LINES} lines")
+
+        size = settings.BATCH_CHECKPOINT_SIZE
+        segments = (len(lines) + size - 1) // size
+        # 检查点：已完成的段数由已处理条数推出
+        done = self.task.completed // size
+        if not await crud.task.update_unless_cancelled(
+            db,
+            db_obj=self.task,
+            obj_in={"status": TaskStatus.PROGRESS, "total": len(lines)},
+        ):
+            logger.info(f"batch {self.batch_id} cancelled")
+            return TaskStatus.CANCELLED
+
+        for segment in range(done, segments):
+            await db.refresh(self.task, ["status"])
+            if self.task.status == TaskStatus.CANCELLED:
+                logger.info(f"batch {self.batch_id} cancelled")
+                return TaskStatus.CANCELLED
+            chunk = lines[segment * size : (segment + 1) * size]
+            failed = await self._run_segment(segment, chunk)
+            await crud.task.update(
+                db,
+                db_obj=self.task,
+                obj_in={
+                    "completed": segment * size + len(chunk),
+                    "failed": self.task.failed + failed,
+                },
+            )
+            await usage_meter.flush()
+
+        output_file_id = await self._finish(db, segments)
+        # 最后一段执行期间可能已被取消，不覆盖取消状态；结果文件仍会登记
+        if not await crud.task.update_unless_cancelled(
+            db,
+            db_obj=self.task,
+            obj_in={"status": TaskStatus.SUCCESS, "output_file_id": output_file_id},
+        ):
+            logger.info(f"batch {self.batch_id} cancelled")
+            return TaskStatus.CANCELLED
+        return TaskStatus.SUCCESS
+
+
+async def execute(batch_id: str, final: bool) -> Optional[TaskStatus]:
+    """
+    执行批量任务；final 为 True 表示已无重试机会，失败时把任务标记为失败。
+    PERMANENT_ERRORS 不再重试，直接标记为失败。
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            task = await crud.task.get(db, primary_key=batch_id)
+            if task is None or task.status in (
+                TaskStatus.SUCCESS,
+                TaskStatus.CANCELLED,
+            ):
+                return task.status if task else None
+            try:
+                return await BatchRunner(task).run(db)
+            except Exception as e:
+                await db.rollback()
+                values = {"error": str(e)}
+                if final or isinstance(e, PERMANENT_ERRORS):
+                    values["status"] = TaskStatus.FAILED
+                await crud.task.update_unless_cancelled(db, db_obj=task, obj_in=values)
+                raise
+    finally:
+        await usage_meter.flush()
+        await release_loop_resources(http_clients=True, redis=True)
+
+
+@celery_app.task(
+    bind=True,
+    name="run_batch",
+    queue="low_priority",
+    max_retries=settings.BATCH_TASK_MAX_RETRIES,
+)
+def run_batch(self, batch_id: str):
+    final = self.request.retries >= self.max_retries
+    try:
+        status = asyncio.run(execute(batch_id, final))
+    except Exception as e:
+        if final or isinstance(e, PERMANENT_ERRORS):
+            raise
+        # 从检查点继续
+        raise self.retry(
+            exc=e, countdown=settings.BATCH_RETRY_BACKOFF * 2**self.request.retries
+        )
+    logger.info(f"batch {batch_id} finished: {status}")
+    return status.value if status else None
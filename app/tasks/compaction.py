@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from app.celery_app import celery_app
+from app.config import settings
+from app.core.llm import llm_provider
+from app.core.llm.context import count_content
+from app.core.llm.tokens import content_text
+from app.core.redis import redis_client
+from app.crud.chat import conversation_crud, message_crud
+from app.models.chat import Message, RoleType
+from app.models.db import AsyncSessionLocal
+from app.schemas.chat import ChatCompletionRequest, ChatMessage
+from app.services.chat_history import SUMMARY_PREFIX, context_cache
+from app.tasks.runtime import release_loop_resources
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTION = (
+    "你负责压缩一段长对话的早期内容。请结合已有摘要与新的对话片段，输出一份更新后的摘要，"
+    "保留事实、结论、用户的偏好与约束、仍未解决的问题，省略寒暄与重复内容。"
+    "摘要将作为后续对话的上下文，只输出摘要本身。"
+)
+
+LOCK_PREFIX = "chat:compact:"
+
+
+def _chunks(messages: List[Message], budget: int) -> List[List[Message]]:
+    """按 token 预算把消息切分为若干段，每段至少一条消息"""
+    chunks: List[List[Message]] = []
+    current: List[Message] = []
+    size = 0
+    for m in messages:
+        tokens = m.token_count or count_content(m.content, m.model)
+        if current and size + tokens > budget:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(m)
+        size += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _transcript(messages: List[Message]) -> str:
+    return "\n\n".join(f"[{m.role.value}] {content_text(m.content)}" for m in messages)
+
+
+async def summarize(
+    previous: Optional[str], messages: List[Message], model: Optional[str]
+) -> str:
+    parts = []
+    if previous:
+        parts.append(f"已有摘要：\n{previous}")
+    parts.append(f"新的对话片段：\n{_transcript(messages)}")
+    request = ChatCompletionRequest(
+        model=model,
+        messages=[
+            ChatMessage(role="system", content=SUMMARY_INSTRUCTION),
+            ChatMessage(role="user", content="\n\n".join(parts)),
+        ],
+        temperature=0,
+        stream=False,
+        max_tokens=settings.CHAT_COMPACTION_MAX_SUMMARY_TOKENS,
+    )
+    response = await llm_provider.generate(request)
+    return content_text(response.choices[0].message.content).strip()
+
+
+async def compact(conversation_id: str) -> int:
+    """
+    增量压缩会话：保留最近 CHAT_COMPACTION_KEEP_RECENT 条消息，
+    更早且尚未纳入摘要的消息按 CHAT_COMPACTION_CHUNK_TOKENS 分段，逐段合并进摘要，
+    每段完成后立即落库，中断后下次从已完成的位置继续。返回本次压缩的消息条数。
+    """
+    async with AsyncSessionLocal() as db:
+        conversation = await conversation_crud.get_by_id(db, conversation_id)
+        if conversation is None:
+            return 0
+        messages = await message_crud.list_unsummarized_messages(db, conversation)
+        await db.commit()
+
+        older = messages[: max(len(messages) - settings.CHAT_COMPACTION_KEEP_RECENT, 0)]
+        if not older:
+            return 0
+        model = settings.CHAT_COMPACTION_MODEL or next(
+            (
+                m.model
+                for m in reversed(messages)
+                if m.role == RoleType.ASSISTANT and m.model
+            ),
+            None,
+        )
+
+        compacted = 0
+        for chunk in _chunks(older, settings.CHAT_COMPACTION_CHUNK_TOKENS):
+            summary = await summarize(conversation.summary, chunk, model)
+            if not summary:
+                break
+            updated = await conversation_crud.update_summary(
+                db,
+                conversation,
+                summary=summary,
+                token_count=count_content(SUMMARY_PREFIX + summary, model),
+                summarized_until=chunk[-1],
+            )
+            if not updated:
+                # 其他任务已推进了摘要进度
+                logger.info(f"conversation {conversation_id} compacted concurrently")
+                break
+            compacted += len(chunk)
+
+    if compacted:
+        await context_cache.invalidate(conversation_id, conversation.created_by)
+    return compacted
+
+
+async def _run(conversation_id: str) -> int:
+    try:
+        return await compact(conversation_id)
+    finally:
+        try:
+            await redis_client.delete(LOCK_PREFIX + conversation_id)
+        except Exception as e:
+            logger.warning(f"release compaction lock failed: {e}")
+        await release_loop_resources(http_clients=True, redis=True)
+
+
+@celery_app.task(name="compact_conversation", queue="low_priority")
+def compact_conversation(conversation_id: str) -> int:
+    compacted = asyncio.run(_run(conversation_id))
+    logger.info(f"conversation {conversation_id}: compacted {compacted} messages")
+    return compacted
+
+
+async def schedule_compaction(conversation_id: str):
+    """
+    请求结束后调用：为会话排入一次压缩任务。
+    同一会话在 CHAT_COMPACTION_LOCK_TTL 内只排入一次，任务结束时释放。
+    """
+    try:
+        acquired = await redis_client.set(
+            LOCK_PREFIX + conversation_id,
+            1,
+            nx=True,
+            ex=settings.CHAT_COMPACTION_LOCK_TTL,
+        )
+        if not acquired:
+            return
+        await asyncio.to_thread(compact_conversation.delay, conversation_id)
+    except Exception as e:
+        logger.warning(f"schedule compaction for {conversation_id} failed: {e}")
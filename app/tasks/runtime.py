@@ -0,0 +1,15 @@
+from app.core.llm.transport import close_http_clients
+from app.core.redis import redis_client
+from app.models.db import engine
+
+
+async def release_loop_resources(*, http_clients: bool = False, redis: bool = False):
+    """
+    Celery 任务每次 asyncio.run 都是新的事件循环，任务结束前释放绑定在本次循环上的连接。
+    数据库连接池总是释放，HTTP 连接池与 Redis 连接只在任务用到时释放。
+    """
+    if http_clients:
+        await close_http_clients()
+    if redis:
+        await redis_client.aclose()
+    await engine.dispose()
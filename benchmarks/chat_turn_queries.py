@@ -0,0 +1,79 @@
+"""
+一轮对话写路径的数据库语句数。
+
+在进程内调用非流式 /api/v1/chat/completions（LLM 使用 synthetic 后端，鉴权只解析 token），
+分别统计新会话与已有会话一轮对话执行的 SQL 语句数（metrics 中的 db_statements）。
+写入使用自动提交会话，没有额外的 BEGIN / COMMIT，因此语句数即数据库往返次数：
+用户消息（新会话时连同会话）一次，助手消息一次。
+
+需要可用的 PostgreSQL（按 POSTGRES_* 配置连接，并已执行迁移）。
+
+用法:
+    python benchmarks/chat_turn_queries.py
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.config import settings  # noqa: E402
+
+
+def statements() -> float:
+    from app.core.metrics import metrics
+
+    return metrics.snapshot()["counters"].get("db_statements", 0)
+
+
+async def turn(client, conversation_id=None) -> tuple[str, float]:
+    body = {
+        "messages": [{"role": "user", "content": "hello"}],
+        "conversation_id": conversation_id,
+        # 请求默认为流式，显式关闭以测量非流式路径
+        "stream": False,
+    }
+    before = statements()
+    r = await client.post("/api/v1/chat/completions", json=body)
+    r.raise_for_status()
+    return r, statements() - before
+
+
+async def run():
+    import httpx
+
+    from app.api.auth import get_current_user_id
+    from app.crud.chat import conversation_crud
+    from app.main import app
+    from app.models.db import AsyncSessionLocal
+
+    user_id = str(uuid.uuid4())
+    app.dependency_overrides[get_current_user_id] = lambda: user_id
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        _, new_count = await turn(client)
+        async with AsyncSessionLocal() as db:
+            conversations = await conversation_crud.list_conversations(
+                db, created_by=user_id
+            )
+        conversation_id = conversations["list"][0].id
+        _, follow_count = await turn(client, conversation_id)
+
+    print(f"new conversation turn:      {new_count:.0f} statements")
+    print(f"existing conversation turn: {follow_count:.0f} statements")
+
+
+def main():
+    settings.LLM_DEFAULT_BACKENDS = ["synthetic"]
+    settings.LLM_ROUTES = {}
+    settings.SYNTHETIC_LLM.ttft_ms = 0
+    settings.SYNTHETIC_LLM.tokens_per_second = 10000
+    settings.SYNTHETIC_LLM.error_rate = 0
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
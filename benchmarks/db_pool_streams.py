@@ -0,0 +1,114 @@
+"""
+流式对话期间的数据库连接池占用测试。
+
+在进程内启动应用（LLM 使用 synthetic 后端，鉴权替换为固定用户），
+并发发起 N 个流式 /api/v1/chat/completions 请求，在所有流都处于生成中时采样连接池的
+checked_out 连接数。流式生成期间不应占用连接，峰值不超过 MAX_CHECKED_OUT，与 N 无关。
+
+需要可用的 PostgreSQL（按 POSTGRES_* 配置连接，并已执行迁移）。
+
+用法:
+    python benchmarks/db_pool_streams.py [--streams 50] [--seconds 3]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.config import settings  # noqa: E402
+
+# 生成期间允许同时占用的连接数（其他请求的短事务）
+MAX_CHECKED_OUT = 2
+
+
+async def run(streams: int, port: int) -> int:
+    import httpx
+    import uvicorn
+
+    from app.api.auth import get_current_user_id
+    from app.main import app
+    from app.models.db import pool_stats
+
+    user_id = str(uuid.uuid4())
+    app.dependency_overrides[get_current_user_id] = lambda: user_id
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    first_tokens = 0
+    all_streaming = asyncio.Event()
+
+    async def chat(client: httpx.AsyncClient):
+        nonlocal first_tokens
+        body = {
+            "messages": [{"role": "user", "content": "hello"}],
+            "stream": True,
+        }
+        async with client.stream("POST", "/api/v1/chat/completions", json=body) as r:
+            r.raise_for_status()
+            counted = False
+            async for _ in r.aiter_bytes():
+                if not counted:
+                    counted = True
+                    first_tokens += 1
+                    if first_tokens == streams:
+                        all_streaming.set()
+
+    limits = httpx.Limits(max_connections=streams)
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=None
+    ) as client:
+        start = time.monotonic()
+        tasks = [asyncio.create_task(chat(client)) for _ in range(streams)]
+        await all_streaming.wait()
+        print(f"{streams} streams active after {time.monotonic() - start:.2f}s")
+
+        samples = []
+        while not any(t.done() for t in tasks):
+            samples.append(pool_stats()["checked_out"])
+            await asyncio.sleep(0.05)
+        await asyncio.gather(*tasks)
+
+    server.should_exit = True
+    await serving
+
+    peak = max(samples) if samples else 0
+    print(f"pool: {pool_stats()}")
+    print(f"checked out while streaming: peak={peak} samples={len(samples)}")
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--port", type=int, default=9012)
+    args = parser.parse_args()
+
+    # 每个流按 seconds 秒匀速生成，保证采样时所有流同时处于生成中
+    settings.LLM_DEFAULT_BACKENDS = ["synthetic"]
+    settings.LLM_ROUTES = {}
+    settings.SYNTHETIC_LLM.ttft_ms = 50
+    settings.SYNTHETIC_LLM.ttft_distribution = "fixed"
+    settings.SYNTHETIC_LLM.response_tokens_min = 100
+    settings.SYNTHETIC_LLM.response_tokens_max = 100
+    settings.SYNTHETIC_LLM.tokens_per_second = 100 / args.seconds
+    settings.SYNTHETIC_LLM.token_distribution = "fixed"
+    settings.SYNTHETIC_LLM.error_rate = 0
+    settings.SYNTHETIC_LLM.stream_error_rate = 0
+
+    peak = asyncio.run(run(args.streams, args.port))
+    sys.exit(0 if peak <= MAX_CHECKED_OUT else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+流式转发 CPU 开销基准测试。
+
+对比 OpenAIProvider 两种流式模式中每个 token 的 CPU 时间：
+  - parsed:      SDK 解码 chunk -> model_dump -> ChatCompletionStreamResponse 校验 -> model_dump_json
+  - passthrough: 原始字节按帧切分，SSEScanner 只提取 content / finish_reason / usage
+
+不依赖网络，直接用构造好的上游 SSE 字节流驱动两条路径。
+
+用法:
+    python benchmarks/stream_passthrough.py [--tokens 20000] [--frames-per-read 4]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from openai.types.chat import ChatCompletionChunk  # noqa: E402
+
+from app.core.llm.stream import SSEScanner, StreamEvent, encode_sse  # noqa: E402
+from app.schemas.chat import ChatCompletionStreamResponse  # noqa: E402
+
+
+def build_upstream(tokens: int) -> list[bytes]:
+    """构造一条 OpenAI 兼容的上游 SSE 字节流，按帧返回"""
+    frames = []
+    base = {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": 1700000000,
+        "model": "bench-model",
+        "system_fingerprint": "fp_bench",
+    }
+    for i in range(tokens):
+        delta = {"content": f"tok{i % 97} "}
+        if i == 0:
+            delta["role"] = "assistant"
+        chunk = {
+            **base,
+            "choices": [
+                {"index": 0, "delta": delta, "logprobs": None, "finish_reason": None}
+            ],
+        }
+        frames.append(f"data: {json.dumps(chunk)}\n\n".encode())
+    end = {
+        **base,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": 12,
+            "completion_tokens": tokens,
+            "total_tokens": 12 + tokens,
+        },
+    }
+    frames.append(f"data: {json.dumps(end)}\n\n".encode())
+    frames.append(b"data: [DONE]\n\n")
+    return frames
+
+
+def reads_of(frames: list[bytes], frames_per_read: int) -> list[bytes]:
+    """把帧合并为网络读取大小的字节块，并在块之间错开边界"""
+    raw = b"".join(frames)
+    size = max(1, len(raw) // len(frames) * frames_per_read - 7)
+    return [raw[i : i + size] for i in range(0, len(raw), size)]
+
+
+def run_parsed(frames: list[bytes]) -> str:
+    parts = []
+    for frame in frames:
+        payload = frame[len(b"data: ") :].strip()
+        if payload == b"[DONE]":
+            break
+        # SDK 侧的解码
+        chunk = ChatCompletionChunk.model_validate(json.loads(payload))
+        # 原有的三次对象往返
+        sse_chunk = ChatCompletionStreamResponse.model_validate(chunk.model_dump())
+        event = StreamEvent(
+            data=encode_sse(sse_chunk.model_dump_json(exclude_none=True)),
+            usage=sse_chunk.usage,
+        )
+        if sse_chunk.choices:
+            event.content = sse_chunk.choices[0].delta.content
+        if event.content:
+            parts.append(event.content)
+    return "".join(parts)
+
+
+def run_passthrough(reads: list[bytes]) -> str:
+    parts = []
+    scanner = SSEScanner()
+    for raw in reads:
+        for event in scanner.feed(raw):
+            if event.content:
+                parts.append(event.content)
+    for event in scanner.flush():
+        if event.content:
+            parts.append(event.content)
+    return "".join(parts)
+
+
+def measure(fn, arg, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        fn(arg)
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--frames-per-read", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    frames = build_upstream(args.tokens)
+    reads = reads_of(frames, args.frames_per_read)
+    assert run_parsed(frames) == run_passthrough(reads)
+
+    parsed = measure(run_parsed, frames, args.repeat)
+    passthrough = measure(run_passthrough, reads, args.repeat)
+
+    print(f"tokens: {args.tokens}")
+    print(f"parsed:      {parsed / args.tokens * 1e6:8.2f} us CPU/token")
+    print(f"passthrough: {passthrough / args.tokens * 1e6:8.2f} us CPU/token")
+    print(f"speedup:     {parsed / passthrough:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+流式生成期间不应占用数据库连接：并发发起 N 个 synthetic 流，
+在所有流都处于生成中时采样连接池的 checked_out 连接数。
+需要可用的 PostgreSQL（按 POSTGRES_* 配置连接，并已执行迁移），不可用时跳过。
+"""
+
+import asyncio
+import socket
+import uuid
+
+import httpx
+import pytest
+import uvicorn
+from sqlalchemy import text
+
+from app.api.auth import get_current_user_id
+from app.config import SyntheticLLMConfig, settings
+from app.core.llm.router import RouterProvider
+from app.main import app
+from app.models.db import engine, pool_stats
+from app.services import chat_service
+
+STREAMS = 20
+MAX_CHECKED_OUT = 2
+
+
+async def _database_available() -> bool:
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("select 1"))
+        return True
+    except Exception:
+        return False
+    finally:
+        await engine.dispose()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _peak_checked_out(streams: int, port: int) -> int:
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    first_tokens = 0
+    all_streaming = asyncio.Event()
+
+    async def chat(client: httpx.AsyncClient):
+        nonlocal first_tokens
+        body = {"messages": [{"role": "user", "content": "hello"}], "stream": True}
+        async with client.stream("POST", "/api/v1/chat/completions", json=body) as r:
+            r.raise_for_status()
+            counted = False
+            async for _ in r.aiter_bytes():
+                if not counted:
+                    counted = True
+                    first_tokens += 1
+                    if first_tokens == streams:
+                        all_streaming.set()
+
+    try:
+        limits = httpx.Limits(max_connections=streams)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=None
+        ) as client:
+            tasks = [asyncio.create_task(chat(client)) for _ in range(streams)]
+            await asyncio.wait_for(all_streaming.wait(), 30)
+            samples = []
+            while not any(t.done() for t in tasks):
+                samples.append(pool_stats()["checked_out"])
+                await asyncio.sleep(0.02)
+            await asyncio.gather(*tasks)
+    finally:
+        server.should_exit = True
+        await serving
+        await engine.dispose()
+    assert samples, "streams finished before sampling"
+    return max(samples)
+
+
+def test_streams_do_not_hold_connections(monkeypatch):
+    if not asyncio.run(_database_available()):
+        pytest.skip("PostgreSQL is not available")
+
+    # 每个流匀速生成约 2 秒，保证采样时所有流同时处于生成中
+    monkeypatch.setattr(
+        settings,
+        "SYNTHETIC_LLM",
+        SyntheticLLMConfig(
+            ttft_ms=50,
+            ttft_distribution="fixed",
+            response_tokens_min=100,
+            response_tokens_max=100,
+            tokens_per_second=50,
+            token_distribution="fixed",
+        ),
+    )
+    monkeypatch.setattr(chat_service, "llm_provider", RouterProvider({}, ["synthetic"]))
+    user_id = str(uuid.uuid4())
+    monkeypatch.setitem(app.dependency_overrides, get_current_user_id, lambda: user_id)
+
+    peak = asyncio.run(_peak_checked_out(STREAMS, _free_port()))
+    assert peak <= MAX_CHECKED_OUT
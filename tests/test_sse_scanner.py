@@ -0,0 +1,40 @@
+import pytest
+
+from app.core.llm.stream import SSEScanner
+
+CHUNK = b'data: {"choices":[{"index":0,"delta":{"content":"hi"}}]}'
+FINISH = b'data: {"choices":[{"index":0,"delta":{},"finish_reason":"stop"}]}'
+
+
+def scan(chunks):
+    scanner = SSEScanner()
+    events = []
+    for chunk in chunks:
+        events.extend(scanner.feed(chunk))
+    events.extend(scanner.flush())
+    return scanner, events
+
+
+@pytest.mark.parametrize("eol", [b"\n", b"\r\n", b"\r"])
+def test_line_endings(eol):
+    body = CHUNK + eol * 2 + FINISH + eol * 2 + b"data: [DONE]" + eol * 2
+    scanner, events = scan([body])
+    assert [e.content for e in events] == ["hi", None, None]
+    assert events[1].finish_reason == "stop"
+    assert all(e.data.endswith(b"\n\n") and b"\r" not in e.data for e in events)
+    assert scanner.done
+
+
+def test_crlf_split_across_chunks():
+    body = CHUNK + b"\r\n\r\n" + FINISH + b"\r\n\r\n"
+    for cut in range(1, len(body)):
+        _, events = scan([body[:cut], body[cut:]])
+        assert [e.content for e in events] == ["hi", None]
+        assert events[1].finish_reason == "stop"
+
+
+def test_flush_trailing_cr():
+    scanner = SSEScanner()
+    assert scanner.feed(CHUNK + b"\r") == []
+    events = scanner.flush()
+    assert len(events) == 1 and events[0].content == "hi"